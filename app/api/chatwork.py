@@ -1,26 +1,64 @@
 """
 消息处理核心模块
 """
+import asyncio
+import time
 import uuid
-from typing import Dict, Any, Optional
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Any, Optional, List
 from app.libs.sainiuclient import SainiuClient
+from app.services.dify_router import dify_router
+from app.services.pipeline import message_pipeline, CompletionCallback
+from app.services.message_stream import publish_message
+from app.services.send_scheduler import send_scheduler
+from app.services.reply_stream import SentenceStreamer
+from app.services.answer_cache import answer_cache
+from app.services.dual_model import dual_model_executor
+from app.services.recognition_cache import recognition_cache
+from app.crud.ai_message_recordsCurd import create_ai_message_record
+from app.db.database import AsyncSessionLocal
 from app.common.utils.logger import logger
-from app.common.utils.redis_util import handle_sainiu_message, check_inactive_users
+from app.common.utils.metrics import message_throughput
+from app.common.utils.redis_util import (
+    handle_sainiu_message,
+    handle_sainiu_messages,
+    check_inactive_users,
+    pop_inactive_users,
+    add_burst_message,
+    set_handle_zj_message,
+)
+from app.common.utils.deadline import attach_deadline, current_deadline, DeadlineExceeded
 from app.common.utils.qnapi_helper import parse_response
-from app.common.config.chatwork_config import INFO_TYPE_DICT_CN
-
-
-async def check_new_info_data():
+from app.common.utils.images import fetch_image_bytes, canonical_image_url, resized_image_url
+from app.common.utils.image_preprocess import prepare_image
+from app.common.utils.ocr import classify_with_confidence
+from app.common.utils.images_recognition import OrcTextExtraction
+from app.common.utils.rule import DiFyRuleC
+from app.common.config.chatwork_config import (
+    settings,
+    INFO_TYPE_DICT_CN,
+    BURST_MESSAGE_TYPES,
+    BURST_MERGED_TYPE,
+)
+
+
+async def check_new_info_data() -> int:
     """
     拉取赛牛新消息并处理
+
+    Returns:
+        本轮处理的消息数
     """
+    if settings.DRAIN_ALL_ON:
+        return await drain_new_info_data()
+
     try:
         # 优先检查非活跃用户
-        inactive_data = await check_inactive_users()
+        inactive_data = await pop_inactive_message()
         if inactive_data:
             logger.info("处理非活跃用户消息")
-            await process_message(inactive_data)
-            return
+            await dispatch_message(inactive_data)
+            return 1
 
         # 拉取新消息
         client = SainiuClient()
@@ -29,43 +67,383 @@ async def check_new_info_data():
         # 解析响应
         data = parse_response(response)
         if not data:
-            return
+            return 0
 
-        # 消息去重
+        # 消息去重(重复消息也说明队列非空)
         if not await handle_sainiu_message(data):
-            return
+            return 1
 
         # 处理消息
-        await process_message(data)
+        await dispatch_message(data)
+        return 1
 
     except Exception as e:
         logger.error(f"拉取消息失败: {str(e)}")
+        return 0
+
+
+async def drain_new_info_data() -> int:
+    """
+    拉空所有待处理消息并并发处理
+    同一买家的消息按顺序处理，不同买家并行处理
+
+    Returns:
+        本轮处理的消息数
+    """
+    try:
+        messages = await fetch_pending_messages(settings.DRAIN_MAX_MESSAGES)
+        if not messages:
+            return 0
+
+        logger.info(f"本轮拉取消息数: {len(messages)}")
+        await process_messages_by_buyer(messages)
+        return len(messages)
+
+    except Exception as e:
+        logger.error(f"批量拉取消息失败: {str(e)}")
+        return 0
 
 
-async def process_message(data: Dict[str, Any]):
+async def fetch_pending_messages(limit: int) -> List[Dict[str, Any]]:
     """
-    处理单条消息
+    拉取所有待处理消息(非活跃用户 + 赛牛新消息)
+
+    Args:
+        limit: 最多拉取数量
+
+    Returns:
+        按到达顺序排列的消息列表
+    """
+    messages = []
+
+    # 优先批量收集非活跃用户
+    for inactive_data in await pop_inactive_users(limit):
+        messages.append(merge_burst_messages(inactive_data))
+
+    # 拉取新消息直到队列为空
+    client = SainiuClient()
+    new_messages = []
+    for _ in range(limit - len(messages)):
+        response = await client.get_new_news()
+        data = parse_response(response)
+        if not data:
+            break
+        new_messages.append(data)
+
+    # 批量去重
+    flags = await handle_sainiu_messages(new_messages)
+    messages.extend(data for data, is_new in zip(new_messages, flags) if is_new)
+
+    return messages
+
+
+async def process_messages_by_buyer(messages: List[Dict[str, Any]]):
+    """
+    按买家分组并发处理消息
+
+    Args:
+        messages: 按到达顺序排列的消息列表
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for data in messages:
+        groups[data.get("buyerUid", "")].append(data)
+
+    semaphore = asyncio.Semaphore(settings.PROCESS_CONCURRENCY)
+
+    async def process_buyer(items: List[Dict[str, Any]]):
+        async with semaphore:
+            for item in items:
+                await dispatch_message(item)
+
+    await asyncio.gather(*(process_buyer(items) for items in groups.values()))
+
+
+def get_user_key(data: Dict[str, Any]) -> str:
+    """用户标识: {buyerUid}_{客服昵称}"""
+    return f"{data.get('buyerUid', '')}_{data.get('userNick', '')}"
+
+
+def is_filtered_message(data: Dict[str, Any]) -> bool:
+    """
+    是否为需要过滤的消息(非用户消息、系统消息、内部转接)
+
+    Args:
+        data: 原始消息数据
+    """
+    message = data.get("message", "")
+
+    # 过滤非用户消息
+    if data.get("codeType", "") != "CHAT_RECEIVE_MSG":
+        return True
+
+    # 过滤系统消息
+    if "将为您服务" in message:
+        return True
+
+    if "转交给" in message and "wsy" in message:
+        return True
+
+    return False
+
+
+async def pop_inactive_message() -> Optional[Dict[str, Any]]:
+    """
+    取出一个聚合窗口已到期的买家消息(已合并)
+
+    Returns:
+        合并后的消息数据或None
+    """
+    inactive_data = await check_inactive_users()
+    if not inactive_data:
+        return None
+    return merge_burst_messages(inactive_data)
+
+
+def merge_burst_messages(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    合并聚合窗口内的连续消息为一次AI调用
+
+    Args:
+        data: 非活跃用户数据(burst_messages为窗口内消息)
+
+    Returns:
+        合并后的消息数据
+    """
+    messages = data.pop("burst_messages", None) or [data]
+    if len(messages) == 1:
+        merged = dict(messages[0])
+        merged["burst"] = True
+        _restart_deadline(merged)
+        return merged
+
+    texts, images, links = [], [], []
+    for item in messages:
+        message_type = item.get("type", "")
+        message = item.get("message", "")
+        if message_type == "图片消息":
+            images.append(message)
+        elif message_type == "链接消息":
+            links.append(message)
+        elif message:
+            texts.append(message)
+
+    merged = dict(messages[0])
+    merged.update({
+        "type": BURST_MERGED_TYPE,
+        "message": "\n".join(texts + links),
+        "images": images,
+        "links": links,
+        "burst": True,
+        "burst_message_ids": [item.get("messageId", "") for item in messages],
+    })
+    _restart_deadline(merged)
+    logger.info(f"合并买家连续消息: {get_user_key(merged)}, {len(messages)}条")
+    return merged
+
+
+def _restart_deadline(data: Dict[str, Any]):
+    """聚合窗口是有意的等待，窗口到期后重新计算处理预算"""
+    data.pop("deadline", None)
+    attach_deadline(data)
+
+
+async def dispatch_message(data: Dict[str, Any]):
+    """
+    分发消息: 启用Redis Stream时写入Stream由消费组处理，否则在本进程处理
+    启用聚合窗口时，文本/图片/链接消息先缓存，窗口到期后合并处理
+
+    Args:
+        data: 消息数据
+    """
+    attach_deadline(data)
+
+    if (
+        settings.BURST_ON
+        and not data.get("burst")
+        and data.get("type") in BURST_MESSAGE_TYPES
+        and not is_filtered_message(data)
+    ):
+        if await add_burst_message(
+            get_user_key(data),
+            data,
+            settings.BURST_IDLE_SECONDS,
+            settings.BURST_MAX_WAIT,
+        ):
+            return
+        # 缓存失败时不聚合，直接处理该消息
+
+    if settings.STREAM_ON:
+        await publish_message(data)
+    else:
+        await handle_message(data)
+
+
+async def handle_message(data: Dict[str, Any], on_done: Optional[CompletionCallback] = None):
+    """
+    在本进程处理消息: 流水线已启动时投递到流水线(队列满时阻塞)，否则串行处理
+
+    Args:
+        data: 消息数据
+        on_done: 处理结束回调，参数为处理失败时的异常(完成或被过滤时为None)
+    """
+    if message_pipeline.running:
+        await message_pipeline.submit(data, on_done)
+    else:
+        await process_message(data, on_done)
+
+
+async def process_message(data: Dict[str, Any], on_done: Optional[CompletionCallback] = None):
+    """
+    串行处理单条消息
 
     Args:
         data: 消息数据
+        on_done: 处理结束回调
     """
+    error = None
     try:
-        message_type = data.get("type", "")
-        message_id = data.get("messageId", "")
+        await run_with_deadline(_process_stages, data)
+
+    except Exception as e:
+        error = e
+        logger.error(f"处理消息失败: {str(e)}")
+
+    finally:
+        message_throughput.record()
+
+    if on_done:
+        on_done(error)
+
+
+async def _process_stages(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """依次执行预处理、AI调用、后处理、发送"""
+    message_type = data.get("type", "")
+    message_id = data.get("messageId", "")
+
+    logger.info(f"处理消息: {message_id}, 类型: {message_type}")
+
+    # 预处理
+    processed_data = await preprocess_info(data)
+    if not processed_data:
+        logger.info(f"消息被过滤: {message_id}")
+        return None
+
+    # 调用AI
+    replied_data = await request_ai_reply(processed_data)
+    if not replied_data:
+        return None
+
+    # 回复后处理
+    replied_data = await postprocess_reply(replied_data)
+    if not replied_data:
+        return None
+
+    # 发送回复
+    await send_reply(replied_data)
+    logger.info(f"消息处理完成: {message_id}")
+    return replied_data
+
+
+# 计时器可能略早于截止时间触发，判断预算是否用完时允许的误差(秒)
+_DEADLINE_TOLERANCE = 0.05
+
+
+async def run_with_deadline(
+    handler: Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]],
+    data: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    在消息的剩余预算内执行处理函数，预算用完时执行兜底并结束处理
+
+    Args:
+        handler: 处理函数
+        data: 消息数据
+
+    Returns:
+        处理结果，预算用完返回None
+    """
+    deadline = attach_deadline(data)
+    if deadline is None:
+        return await handler(data)
+
+    token = current_deadline.set(deadline)
+    try:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        result = await asyncio.wait_for(handler(data), remaining)
+        if result is None and time.time() >= deadline - _DEADLINE_TOLERANCE:
+            # 下游调用的超时与剩余预算相同，可能先于wait_for触发并被处理函数吞掉后返回None
+            raise DeadlineExceeded()
+        return result
+
+    except (DeadlineExceeded, asyncio.TimeoutError):
+        if time.time() < deadline - _DEADLINE_TOLERANCE:
+            raise
+        current_deadline.reset(token)
+        token = None
+        await apply_deadline_fallback(data)
+        return None
+
+    finally:
+        if token is not None:
+            current_deadline.reset(token)
+
 
-        logger.info(f"处理消息: {message_id}, 类型: {message_type}")
+def with_deadline(
+    handler: Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+) -> Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]:
+    """包装流水线阶段处理函数，使其遵守消息的处理预算"""
+    async def wrapper(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await run_with_deadline(handler, data)
+
+    wrapper.__name__ = handler.__name__
+    return wrapper
+
+
+async def apply_deadline_fallback(data: Dict[str, Any]):
+    """
+    处理预算用完时的兜底: 发送转接话术，按配置转接人工
+
+    Args:
+        data: 消息数据
+    """
+    fallback = settings.MESSAGE_DEADLINE_FALLBACK
+    logger.warning(
+        f"消息处理超出预算: {data.get('messageId')}, TraceID: {data.get('trace_id')}, 兜底: {fallback}"
+    )
+    if fallback == "none" or is_filtered_message(data):
+        return
 
-        # 预处理
-        processed_data = await preprocess_info(data)
-        if not processed_data:
-            logger.info(f"消息被过滤: {message_id}")
+    try:
+        await deliver_text(data, settings.QN_TRANS_MESSAGE)
+        if fallback != "transfer" or not settings.QN_TRANS_TARGET:
             return
 
-        # 调用AI处理(简化版)
-        logger.info(f"消息处理完成: {message_id}")
+        client = SainiuClient()
+        if settings.QN_TRANS_MODE == "Nick":
+            await client.transfer_buyer_nick(data.get("userNick", ""), data.get("buyerNick", ""), settings.QN_TRANS_TARGET)
+        else:
+            await client.transfer_buyer_to_groups(data.get("userNick", ""), data.get("buyerNick", ""), settings.QN_TRANS_TARGET)
+        await set_handle_zj_message(get_user_key(data))
 
     except Exception as e:
-        logger.error(f"处理消息失败: {str(e)}")
+        logger.error(f"超时兜底失败: {str(e)}")
+
+
+async def ingest_message(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    消息接入: 记录接入时间
+
+    Args:
+        data: 原始消息数据
+
+    Returns:
+        消息数据
+    """
+    data.setdefault("ingest_time", time.time())
+    attach_deadline(data)
+    return data
 
 
 async def preprocess_info(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -80,29 +458,23 @@ async def preprocess_info(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     try:
         message_type = data.get("type", "")
-        message = data.get("message", "")
-        code_type = data.get("codeType", "")
-
-        # 过滤非用户消息
-        if code_type != "CHAT_RECEIVE_MSG":
-            return None
 
-        # 过滤系统消息
-        if "将为您服务" in message:
-            return None
-
-        if "转交给" in message and "wsy" in message:
+        # 过滤非用户消息、系统消息
+        if is_filtered_message(data):
             return None
 
         # 生成TraceID
-        trace_id = str(uuid.uuid4())
-        data["trace_id"] = trace_id
+        trace_id = data.setdefault("trace_id", str(uuid.uuid4()))
+        if data.get("deadline"):
+            logger.debug(f"TraceID: {trace_id}, 剩余预算: {data['deadline'] - time.time():.1f}s")
 
         # 根据消息类型处理
         if message_type == "文本消息":
             return await preprocess_text(data)
         elif message_type == "图片消息":
             return await preprocess_image(data)
+        elif message_type == BURST_MERGED_TYPE:
+            return await preprocess_burst(data)
         elif message_type == "视频消息":
             data["message"] = "转接人工"
             return data
@@ -142,20 +514,275 @@ async def preprocess_image(data: Dict[str, Any]) -> Dict[str, Any]:
     try:
         image_url = data.get("message", "")
         logger.info(f"图片消息预处理: {image_url}")
+        canonical_url = canonical_image_url(image_url)
+
+        # 1. 按规范化URL查识别缓存，命中时不下载图片
+        if settings.RECOGNITION_CACHE_ON:
+            cached = await recognition_cache.get_by_url(canonical_url)
+            if cached:
+                return apply_recognition(data, cached, "url")
+
+        # 2. 流式下载到内存，可请求CDN缩放图(上传Dify在调用时按引擎处理，见DifyClient.get_image_file)
+        content = await fetch_image_bytes(resized_image_url(image_url, settings.IMAGE_CDN_RESIZE))
+
+        # 3. 按图片内容(SHA-256/感知哈希)查识别缓存
+        fingerprint = None
+        if settings.RECOGNITION_CACHE_ON:
+            cached, fingerprint = await recognition_cache.get_by_content(content, canonical_url)
+            if cached:
+                return apply_recognition(data, cached, "content")
+
+        # 4. 内存中缩小解码并按EXIF摆正后YOLO分类 + OCR识别
+        #    (启用INFERENCE_SERVER_ON时经共享内存交给本机推理服务)
+        prepared = await asyncio.to_thread(prepare_image, content)
+        classified, product = await asyncio.gather(
+            classify_with_confidence(prepared.array),
+            OrcTextExtraction.yolo_ocr(prepared.array, prepared.oriented),
+        )
+        producttype, confidence = classified or ("", 0.0)
+        result = {"producttype": producttype, "product": product, "confidence": confidence}
+
+        # 5. 缓存识别结果
+        if fingerprint is not None and product and confidence >= settings.RECOGNITION_CACHE_MIN_CONFIDENCE:
+            await recognition_cache.put(fingerprint, result, canonical_url)
+
+        return apply_recognition(data, result, "model")
+
+    except Exception as e:
+        logger.error(f"图片预处理失败: {str(e)}")
+        return data
 
-        # TODO: 实际图片处理流程
-        # 1. 下载图片
-        # 2. 上传到Dify
-        # 3. YOLO分类
-        # 4. OCR识别
-        # 5. 缓存结果到Redis
 
-        # 占位实现
-        data["product"] = "DZ120V1D"
-        data["producttype"] = "Compressor"
+def apply_recognition(data: Dict[str, Any], result: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """
+    写入图片识别结果
+
+    Args:
+        data: 消息数据
+        result: 识别结果(producttype、product、confidence)
+        source: 结果来源(url/content为缓存命中，model为模型识别)
+
+    Returns:
+        处理后的数据
+    """
+    if result.get("producttype"):
+        data["producttype"] = result["producttype"]
+    if result.get("product"):
+        data["product"] = result["product"]
+    data["recognition_source"] = source
+    logger.info(
+        f"图片识别({source}): {result.get('producttype')} / {result.get('product')} "
+        f"({result.get('confidence', 0.0):.2f})"
+    )
+    return data
+
+
+async def preprocess_burst(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    合并消息预处理: 逐张识别图片，型号/分类以;拼接
+
+    Args:
+        data: 合并后的消息数据
+
+    Returns:
+        处理后的数据
+    """
+    products, product_types = [], []
+    for image_url in data.get("images", []):
+        image_data = await preprocess_image({**data, "message": image_url})
+        if image_data.get("product"):
+            products.append(image_data["product"])
+            product_types.append(image_data.get("producttype", ""))
 
+    if products:
+        data["product"] = ";".join(products)
+        data["producttype"] = ";".join(product_types)
+
+    return await preprocess_text(data)
+
+
+async def request_ai_reply(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    调用Dify生成回复
+
+    Args:
+        data: 预处理后的消息数据
+
+    Returns:
+        带有answer字段的数据，调用失败返回None
+    """
+    user_key = get_user_key(data)
+
+    inputs = {}
+    if data.get("product"):
+        inputs["product"] = data["product"]
+        inputs["producttype"] = data.get("producttype", "")
+
+    # 双模型模式: 主引擎生成 + 审核引擎并行审核
+    dual_model = settings.AUX_OFF_ON and bool(settings.APP_KEY_TWO)
+
+    # 逐句发送: 回复生成过程中每句经规则处理后立即发给买家(双模型模式需审核后整段发送)
+    streamer = None
+    if settings.DIFY_STREAM_REPLY_ON and not dual_model:
+        streamer = SentenceStreamer(lambda text: deliver_text(data, text))
+
+    images = None
+    if settings.DIFY_SEND_IMAGES:
+        if data.get("type") == "图片消息":
+            images = [data.get("message", "")]
+        elif data.get("images"):
+            images = data["images"]
+
+    async def call_dify() -> Dict[str, Any]:
+        if dual_model:
+            return await dual_model_executor.run(
+                query=data.get("message", ""),
+                user=user_key,
+                inputs=inputs,
+                images=images,
+            )
+        return await dify_router.chat(
+            query=data.get("message", ""),
+            user=user_key,
+            inputs=inputs,
+            on_delta=streamer.feed if streamer else None,
+            images=images,
+        )
+
+    start = time.monotonic()
+    try:
+        # 纯文本问题按问题+产品上下文缓存回复
+        if (
+            settings.ANSWER_CACHE_ON
+            and data.get("type") in ("文本消息", BURST_MERGED_TYPE)
+            and not data.get("images")
+        ):
+            context = f"{inputs.get('product', '')}|{inputs.get('producttype', '')}"
+            result, source = await answer_cache.fetch(data.get("message", ""), context, call_dify)
+            data["answer_cache"] = source
+        else:
+            result = await call_dify()
+
+        if streamer and streamer.received:
+            # 等待已切分的句子发完；回复中断时不发送不完整的末句
+            await streamer.finish(send_tail=bool(result))
+
+    finally:
+        if streamer:
+            # 处理被中止(如预算用完)时不再发送排队中的句子
+            streamer.cancel()
+
+    data["main_latency_ms"] = result.get("main_latency_ms", int((time.monotonic() - start) * 1000))
+    data["review_latency_ms"] = result.get("review_latency_ms")
+    data["dify_message_id"] = result.get("message_id", "")
+    data["dify_conversation_id"] = result.get("conversation_id", "")
+    data["dify_engine"] = result.get("engine", "")
+
+    if streamer and streamer.received:
+        data["streamed"] = True
+        data["answer"] = streamer.text
         return data
 
-    except Exception as e:
-        logger.error(f"图片预处理失败: {str(e)}")
+    if not result:
+        logger.warning(f"Dify未返回结果: {data.get('messageId')}")
+        return None
+
+    data["answer"] = result.get("answer", "")
+    return data
+
+
+async def postprocess_reply(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    AI回复后处理(过滤、去重、URL检查)
+
+    Args:
+        data: 带有answer字段的数据
+
+    Returns:
+        处理后的数据，回复被过滤返回None
+    """
+    # 逐句发送时已按句处理
+    if data.get("streamed"):
         return data
+
+    answer = data.get("answer", "")
+    if not answer or DiFyRuleC.filter_data(answer) == "continue":
+        return None
+
+    answer = DiFyRuleC.deduplication(answer)
+    answer = DiFyRuleC.url_check(answer)
+    data["answer"] = answer
+    return data
+
+
+async def send_reply(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    通过赛牛发送回复
+
+    Args:
+        data: 带有answer字段的数据
+
+    Returns:
+        消息数据
+    """
+    # 逐句发送时已发出
+    if not data.get("streamed"):
+        await deliver_text(data, data["answer"])
+
+    if settings.AI_RECORD_ON:
+        await save_ai_record(data)
+    return data
+
+
+async def save_ai_record(data: Dict[str, Any]):
+    """
+    写入AI消息记录(含主引擎与审核引擎耗时)
+
+    Args:
+        data: 已发送回复的消息数据
+    """
+    type_codes = {name: str(code) for code, name in INFO_TYPE_DICT_CN.items()}
+    try:
+        async with AsyncSessionLocal() as db:
+            await create_ai_message_record(
+                db,
+                dify_id=data.get("dify_conversation_id", ""),
+                user_nickname=data.get("userNick", ""),
+                buyer_uid=data.get("buyerUid", ""),
+                message=data.get("answer", ""),
+                send_dify_data_info=data.get("message", ""),
+                data_type=type_codes.get(data.get("type", ""), "7"),
+                sainiu_id=data.get("messageId", ""),
+                main_latency_ms=data.get("main_latency_ms"),
+                review_latency_ms=data.get("review_latency_ms"),
+            )
+
+    except Exception as e:
+        # 回复已发出，记录失败不影响消息处理结果
+        logger.error(f"写入AI消息记录失败: {str(e)}")
+
+
+async def deliver_text(data: Dict[str, Any], text: str):
+    """
+    向消息对应的买家发送一段回复(启用出站调度时排队发送)
+
+    Args:
+        data: 消息数据
+        text: 回复内容
+    """
+    if settings.SEND_SCHEDULER_ON:
+        if await send_scheduler.send(
+            user_nick=data.get("userNick", ""),
+            buyer_nick=data.get("buyerNick", ""),
+            text=text,
+        ):
+            logger.info(f"回复已加入发送队列: {data.get('messageId')}")
+        return
+
+    client = SainiuClient()
+    await client.send_messages(
+        user_nick=data.get("userNick", ""),
+        buyer_nick=data.get("buyerNick", ""),
+        text=text,
+    )
+    logger.info(f"回复已发送: {data.get('messageId')}")
@@ -4,7 +4,24 @@
 from fastapi import APIRouter
 from app.redis.redis_client import get_redis_client
 from app.db.database import engine
+from app.common.config.chatwork_config import settings
+from app.libs.difyclinet import dify_pool_stats
+from app.services.dify_router import dify_router
+from app.services.answer_cache import answer_cache
+from app.services.recognition_cache import recognition_cache
+from app.services.dual_model import dual_model_executor
+from app.services.inference import inference_client
 from app.common.utils.logger import logger
+from app.common.utils.ocr import classify_batcher
+from app.common.utils.images_recognition import ocr_batcher
+from app.common.utils.dedup_store import dedup_memory_report
+from app.common.utils.metrics import message_throughput
+from app.services.pipeline import message_pipeline
+from app.services.push_queue import push_queue
+from app.services.message_stream import get_stream_stats
+from app.services.send_scheduler import send_scheduler
+from app.task.leader import leader_election
+from app.task.poller import message_poller
 
 router = APIRouter()
 
@@ -31,3 +48,102 @@ async def check_mysql():
     except Exception as e:
         logger.error(f"MySQL连接失败: {str(e)}")
         return {"status": "error", "message": str(e)}
+
+
+@router.get("/debug/throughput")
+async def check_throughput():
+    """查看消息处理吞吐量(条/秒)"""
+    return {"status": "ok", "throughput": message_throughput.snapshot()}
+
+
+@router.get("/debug/pipeline")
+async def check_pipeline():
+    """查看流水线各阶段队列深度与延迟"""
+    return {
+        "status": "ok",
+        "running": message_pipeline.running,
+        "stages": message_pipeline.stats(),
+        "push_queue": push_queue.stats(),
+    }
+
+
+@router.get("/debug/poller")
+async def check_poller():
+    """查看自适应轮询统计(超时/跳过轮次等)"""
+    return {"status": "ok", "poller": message_poller.stats()}
+
+
+@router.get("/debug/stream")
+async def check_stream():
+    """查看Redis Stream分区长度、pending数量与持有者"""
+    try:
+        return {"status": "ok", "stream": await get_stream_stats()}
+    except Exception as e:
+        logger.error(f"获取Stream统计失败: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/debug/leader")
+async def check_leader():
+    """查看各定时任务主节点租约持有者"""
+    try:
+        return {"status": "ok", "leader": await leader_election.describe()}
+    except Exception as e:
+        logger.error(f"获取主节点租约失败: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/debug/dedup")
+async def check_dedup():
+    """查看去重存储内存占用(每百万条消息估算及当前分桶实测)"""
+    try:
+        return {"status": "ok", "report": await dedup_memory_report()}
+    except Exception as e:
+        logger.error(f"获取去重存储报告失败: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/debug/dify")
+async def check_dify():
+    """查看各APP_KEY的Dify连接池及引擎路由统计"""
+    return {
+        "status": "ok",
+        "pools": dify_pool_stats(),
+        "router": dify_router.stats(),
+        "dual_model": dual_model_executor.stats(),
+    }
+
+
+@router.get("/debug/sender")
+async def check_sender():
+    """查看各客服账号的发送队列深度与发送延迟"""
+    return {"status": "ok", "running": settings.SEND_SCHEDULER_ON, "accounts": send_scheduler.stats()}
+
+
+@router.get("/debug/answer_cache")
+async def check_answer_cache():
+    """查看Dify回复缓存命中率"""
+    return {"status": "ok", "enabled": settings.ANSWER_CACHE_ON, "cache": answer_cache.stats()}
+
+
+@router.get("/debug/recognition_cache")
+async def check_recognition_cache():
+    """查看图片识别结果缓存命中率"""
+    return {"status": "ok", "enabled": settings.RECOGNITION_CACHE_ON, "cache": recognition_cache.stats()}
+
+
+@router.get("/debug/inference")
+async def check_inference():
+    """查看本机推理服务状态、调用延迟及微批大小/耗时分布"""
+    result = {"status": "ok", "enabled": settings.INFERENCE_SERVER_ON, "client": inference_client.stats()}
+    if not settings.INFERENCE_SERVER_ON:
+        # 本进程推理时的微批统计
+        result["batching"] = {"classify": classify_batcher.stats(), "yolo_ocr": ocr_batcher.stats()}
+    else:
+        try:
+            result["server"] = await inference_client.ping()
+        except Exception as e:
+            logger.error(f"推理服务不可用: {str(e)}")
+            result["status"] = "error"
+            result["message"] = str(e)
+    return result
@@ -8,6 +8,14 @@ from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
 from app.db.database import init_db
 from app.redis.redis_client import close_redis
+from app.libs.sainiuclient import get_sainiu_http_client, close_sainiu_http_client
+from app.libs.difyclinet import init_dify_clients, close_dify_clients
+from app.common.utils.images import close_image_http_client
+from app.services.pipeline import start_pipeline, stop_pipeline
+from app.services.push_queue import start_push_queue, stop_push_queue
+from app.services.message_stream import stream_consumer
+from app.services.send_scheduler import send_scheduler
+from app.task.leader import leader_election
 from app.task.scheduler import start_scheduler, stop_scheduler
 
 
@@ -21,6 +29,27 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("数据库初始化完成")
 
+    # 创建赛牛连接池
+    await get_sainiu_http_client()
+
+    # 创建Dify连接池并预建立连接
+    await init_dify_clients()
+
+    # 启动分阶段流水线
+    if settings.PIPELINE_ON:
+        start_pipeline()
+
+    # 启动推送消息队列
+    start_push_queue()
+
+    # 启动Redis Stream消费
+    if settings.STREAM_ON and settings.STREAM_CONSUME_ON:
+        stream_consumer.start()
+
+    # 启动定时任务主节点选举
+    if settings.LEADER_ELECTION_ON:
+        leader_election.start()
+
     # 启动定时任务
     start_scheduler()
 
@@ -34,6 +63,30 @@ async def lifespan(app: FastAPI):
     # 停止定时任务
     stop_scheduler()
 
+    # 释放主节点租约，便于其他进程快速接管
+    await leader_election.stop()
+
+    # 停止推送消息队列
+    await stop_push_queue()
+
+    # 停止Redis Stream消费
+    await stream_consumer.stop()
+
+    # 停止分阶段流水线
+    await stop_pipeline()
+
+    # 发出排队中的回复
+    await send_scheduler.stop()
+
+    # 关闭赛牛连接池
+    await close_sainiu_http_client()
+
+    # 关闭Dify连接池
+    await close_dify_clients()
+
+    # 关闭图片下载连接池
+    await close_image_http_client()
+
     # 关闭Redis连接
     await close_redis()
 
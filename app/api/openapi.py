@@ -1,25 +1,168 @@
 """
 外部推送接口
 """
+from typing import Any, Dict, List
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
-from app.api.chatwork import process_message
+from app.common.utils.deadline import attach_deadline
+from app.common.utils.redis_util import (
+    handle_sainiu_message,
+    handle_sainiu_messages,
+    release_sainiu_message,
+)
+from app.services.push_queue import push_queue
 
 router = APIRouter()
 
+# 推送消息必填字段
+REQUIRED_PUSH_FIELDS = ("buyerUid", "codeType")
+
+
+def _validate_push_message(data: Any) -> bool:
+    """校验推送消息格式"""
+    return isinstance(data, dict) and all(data.get(field) for field in REQUIRED_PUSH_FIELDS)
+
+
+async def _enqueue_push_message(data: Dict[str, Any]) -> str:
+    """
+    校验、去重并入队推送消息
+
+    Args:
+        data: 赛牛推送的消息数据
+
+    Returns:
+        accepted/duplicate/invalid/full/unavailable
+    """
+    if not _validate_push_message(data):
+        return "invalid"
+
+    if not push_queue.running:
+        return "unavailable"
+
+    # 先预留队列名额再去重，保证标记为已接收的消息一定能入队
+    # (Bloom去重标记无法撤销，入队失败时赛牛的重试会被误判为重复)
+    if not push_queue.reserve(data):
+        return "full"
+
+    try:
+        is_new = await handle_sainiu_message(data)
+    except BaseException:
+        push_queue.cancel_reservation(data)
+        raise
+    if not is_new:
+        push_queue.cancel_reservation(data)
+        return "duplicate"
+
+    # 接入即开始计算处理预算(含排队时间)
+    attach_deadline(data)
+    if not push_queue.put_reserved(data):
+        # 入队失败时撤销去重标记，保证赛牛重试时能被重新接收
+        await release_sainiu_message(data)
+        return "full"
+
+    return "accepted"
+
+
+async def _enqueue_push_messages(items: List[Any]) -> List[str]:
+    """
+    批量校验、去重(一次管道往返)并入队推送消息
+
+    Args:
+        items: 赛牛推送的消息数组
+
+    Returns:
+        与输入一一对应的状态
+    """
+    results = ["invalid" if not _validate_push_message(item) else "" for item in items]
+
+    if not push_queue.running:
+        return [status or "unavailable" for status in results]
+
+    # 逐条预留队列名额(同一分区的多条消息分别占用名额)，再批量去重
+    for i, item in enumerate(items):
+        if not results[i] and not push_queue.reserve(item):
+            results[i] = "full"
+    valid = [i for i, status in enumerate(results) if not status]
+
+    try:
+        flags = await handle_sainiu_messages([items[i] for i in valid])
+    except BaseException:
+        for i in valid:
+            push_queue.cancel_reservation(items[i])
+        raise
+
+    for i, is_new in zip(valid, flags):
+        item = items[i]
+        if not is_new:
+            push_queue.cancel_reservation(item)
+            results[i] = "duplicate"
+            continue
+        attach_deadline(item)
+        if push_queue.put_reserved(item):
+            results[i] = "accepted"
+        else:
+            await release_sainiu_message(item)
+            results[i] = "full"
+
+    return results
+
+
+def _backpressure_response(status: str, body: Dict[str, Any]) -> JSONResponse:
+    """构造背压应答(429队列满/503服务不可用)"""
+    status_code = 429 if status == "full" else 503
+    return JSONResponse(
+        status_code=status_code,
+        content=body,
+        headers={"Retry-After": str(settings.PUSH_RETRY_AFTER)},
+    )
+
 
 @router.post("/sainiu/getInfo")
 async def sainiu_push(data: dict):
     """
-    赛牛消息推送接口
+    赛牛消息推送接口(入队后立即应答)
 
     Args:
         data: 赛牛推送的消息数据
     """
     try:
         logger.info(f"收到赛牛推送消息: {data.get('messageId', 'unknown')}")
-        await process_message(data)
-        return {"status": "success"}
+        status = await _enqueue_push_message(data)
+
+        if status in ("full", "unavailable"):
+            logger.warning(f"推送消息被拒绝({status}): {data.get('messageId', 'unknown')}")
+            return _backpressure_response(status, {"status": status})
+        if status == "invalid":
+            return JSONResponse(status_code=400, content={"status": "error", "message": "消息格式错误"})
+
+        return {"status": "success", "result": status}
     except Exception as e:
         logger.error(f"处理推送消息失败: {str(e)}")
         return {"status": "error", "message": str(e)}
+
+
+@router.post("/sainiu/getInfo/batch")
+async def sainiu_push_batch(data: List[dict]):
+    """
+    赛牛消息批量推送接口
+
+    Args:
+        data: 赛牛推送的消息数组
+    """
+    try:
+        logger.info(f"收到赛牛批量推送消息: {len(data)}条")
+        results = await _enqueue_push_messages(data)
+        body = {"status": "success", "results": results}
+
+        # 有消息因队列满被拒绝时整体返回背压，已接收的消息重试时会被去重
+        for status in ("full", "unavailable"):
+            if status in results:
+                body["status"] = status
+                return _backpressure_response(status, body)
+
+        return body
+    except Exception as e:
+        logger.error(f"处理批量推送消息失败: {str(e)}")
+        return {"status": "error", "message": str(e)}
@@ -1,7 +1,10 @@
 """
 Celery应用实例
 """
+import asyncio
+import threading
 from celery import Celery
+from celery.signals import worker_process_init
 from app.common.config.chatwork_config import settings
 
 # 创建Celery应用
@@ -29,5 +32,36 @@ celery_app.conf.update(
     worker_max_tasks_per_child=100,
 )
 
+
+@worker_process_init.connect
+def start_stream_consumer(**kwargs):
+    """Worker子进程启动时加入Redis Stream消费组"""
+    if not settings.STREAM_ON:
+        return
+
+    threading.Thread(
+        target=lambda: asyncio.run(_run_stream_consumer()),
+        name="stream-consumer",
+        daemon=True,
+    ).start()
+
+
+async def _run_stream_consumer():
+    """Worker子进程内的事件循环: 创建连接池并运行Stream消费者"""
+    from app.libs.difyclinet import init_dify_clients, close_dify_clients
+    from app.libs.sainiuclient import get_sainiu_http_client, close_sainiu_http_client
+    from app.services.message_stream import StreamConsumer
+    from app.common.utils.images import close_image_http_client
+
+    await get_sainiu_http_client()
+    await init_dify_clients()
+    try:
+        await StreamConsumer().run()
+    finally:
+        await close_dify_clients()
+        await close_sainiu_http_client()
+        await close_image_http_client()
+
+
 if __name__ == "__main__":
     celery_app.start()
@@ -52,15 +52,63 @@ class Settings(BaseSettings):
     SAINIU_API_KEY: str = ""
     QN_TRANS_MODE: str = "Group"  # Group 或 Nick
     QN_TRANS_MESSAGE: str = "亲爱的，稍等给您转专席客服"
+    QN_TRANS_TARGET: str = ""  # 转接目标: Group模式为分组名，Nick模式为客服昵称
+
+    # 赛牛连接池与重试
+    SAINIU_TIMEOUT: float = 30.0  # 默认超时(秒)
+    SAINIU_METHOD_TIMEOUTS: Dict[str, float] = {  # 按方法的超时(秒)
+        "GetNewNews": 5.0,
+        "SendMessages": 15.0,
+        "GetReceptionGroup": 10.0,
+    }
+    SAINIU_MAX_CONNECTIONS: int = 50  # 最大连接数
+    SAINIU_MAX_KEEPALIVE: int = 20  # 最大保活连接数
+    SAINIU_KEEPALIVE_EXPIRY: float = 30.0  # 保活连接空闲过期(秒)
+    SAINIU_RETRY_METHODS: List[str] = ["GetReceptionGroup"]  # 允许重试的幂等方法
+    SAINIU_CONNECT_RETRY_METHODS: List[str] = ["GetNewNews"]  # 非幂等方法，仅在请求未发出(连接失败)时重试
+    SAINIU_MAX_RETRIES: int = 2  # 单次调用最大重试次数
+    SAINIU_RETRY_BASE_DELAY: float = 0.2  # 重试退避基础间隔(秒)
+    SAINIU_RETRY_MAX_DELAY: float = 2.0  # 重试退避最大间隔(秒)
+    SAINIU_RETRY_BUDGET_RATIO: float = 0.1  # 重试量占请求量的比例上限
+    SAINIU_RETRY_MIN_PER_SECOND: float = 1.0  # 每秒保底重试次数
 
     # =============================================================================
     # Dify AI 平台配置
     # =============================================================================
     DIFY_BASE_URL: str = "https://api.dify.ai/v1"
+    DIFY_TIMEOUT: float = 120.0  # 对话请求默认超时(秒)
     APP_KEY: str = ""  # 主对话引擎
     APP_KEY_TWO: str = ""  # 回复审核/优化
     APP_KEY_THREE: str = ""  # 备用对话引擎
     AUX_OFF_ON: bool = False  # 是否启用双模型模式
+    AUX_REVIEW_SEGMENT_CHARS: int = 40  # 主引擎输出积累到该长度的完整句子即提交审核
+    AUX_REVIEW_DEADLINE: float = 3.0  # 主引擎完成后等待审核的最长时间(秒)，超时使用原回复
+    AI_RECORD_ON: bool = False  # 是否写入ai_message_records(含两个模型耗时)
+    DIFY_STREAM_REPLY_ON: bool = False  # 是否按句流式发送回复(首句生成后即发送)
+
+    # Dify连接池
+    DIFY_HTTP2: bool = True  # 是否启用HTTP/2(需安装h2)
+    DIFY_MAX_CONNECTIONS: int = 50  # 每个APP_KEY最大连接数
+    DIFY_MAX_KEEPALIVE: int = 20  # 每个APP_KEY最大保活连接数
+    DIFY_KEEPALIVE_EXPIRY: float = 60.0  # 保活连接空闲过期(秒)
+
+    # Dify图片文件
+    DIFY_SEND_IMAGES: bool = False  # 是否随对话请求发送买家图片(需应用开启视觉能力)
+    DIFY_REMOTE_URL_HOSTS: List[str] = ["alicdn.com", "taobaocdn.com", "tbcdn.cn"]  # Dify可直接访问的图片域名(remote_url)
+    DIFY_FILE_CACHE_TTL: int = 86400  # 图片内容哈希->file_id缓存时长(秒)，与Dify文件保留时长一致
+
+    # Dify引擎路由(主引擎APP_KEY，备用引擎APP_KEY_THREE)
+    DIFY_HEDGE_ON: bool = True  # 主引擎首字超时时是否对冲至备用引擎
+    DIFY_HEDGE_PERCENTILE: float = 95.0  # 对冲截止时间取首字延迟的分位数
+    DIFY_HEDGE_MIN_DELAY: float = 2.0  # 对冲截止时间下限(秒)
+    DIFY_HEDGE_MAX_DELAY: float = 15.0  # 对冲截止时间上限(秒)
+    DIFY_HEDGE_DEFAULT_DELAY: float = 8.0  # 样本不足时的对冲截止时间(秒)
+    DIFY_HEDGE_MIN_SAMPLES: int = 20  # 计算分位数所需的最少样本数
+    DIFY_LATENCY_WINDOW: int = 200  # 首字延迟样本窗口大小
+    DIFY_EWMA_ALPHA: float = 0.2  # 延迟与错误率的EWMA平滑系数
+    DIFY_CIRCUIT_FAILURES: int = 5  # 连续失败次数达到该值时熔断
+    DIFY_CIRCUIT_ERROR_RATE: float = 0.5  # EWMA错误率达到该值时熔断
+    DIFY_CIRCUIT_COOLDOWN: float = 30.0  # 熔断持续时间(秒)，之后放行一个试探请求
 
     # =============================================================================
     # 旺店通 ERP 配置
@@ -87,6 +135,142 @@ class Settings(BaseSettings):
     # 缓存配置
     # =============================================================================
     CACHE_DURATION: int = 20  # 秒
+    CONVERSATION_CACHE_TTL: float = 10.0  # 会话ID进程内缓存时长(秒，0为不缓存)
+    CONVERSATION_CACHE_SIZE: int = 10000  # 会话ID进程内缓存最大条目数
+
+    # =============================================================================
+    # 消息去重配置
+    # =============================================================================
+    DEDUP_TTL: int = 86400  # 去重标记保留时长(秒)
+    DEDUP_BY_MESSAGE_ID: bool = False  # 消息带messageId时按messageId去重
+    DEDUP_BACKEND: str = "key"  # key(每条一个Key) / hash(分桶Hash) / bloom(分桶Bloom过滤器)
+    DEDUP_BUCKET_SECONDS: int = 86400  # hash/bloom分桶时长(秒)
+    DEDUP_BLOOM_CAPACITY: int = 1000000  # 每个Bloom分桶预期消息数
+    DEDUP_BLOOM_ERROR_RATE: float = 0.001  # Bloom误判率
+
+    # =============================================================================
+    # 消息处理并发配置
+    # =============================================================================
+    DRAIN_ALL_ON: bool = False  # 是否每轮拉空所有待处理消息
+    DRAIN_MAX_MESSAGES: int = 200  # 每轮最多拉取消息数
+    PROCESS_CONCURRENCY: int = 16  # 不同买家并发处理上限
+
+    # =============================================================================
+    # 消息处理预算配置
+    # =============================================================================
+    MESSAGE_DEADLINE_ON: bool = False  # 是否为每条消息设置处理截止时间
+    MESSAGE_BUDGET_SECONDS: float = 45.0  # 从接入到发送的总预算(秒)
+    MESSAGE_DEADLINE_FALLBACK: str = "message"  # 超时兜底: message(发送转接话术) / transfer(话术+转人工) / none
+
+    # =============================================================================
+    # 分阶段流水线配置
+    # =============================================================================
+    PIPELINE_ON: bool = False  # 是否启用分阶段流水线
+    PIPELINE_QUEUE_SIZE: int = 100  # 每个worker队列容量
+    PIPELINE_INGEST_WORKERS: int = 2  # 接入阶段worker数
+    PIPELINE_PREPROCESS_WORKERS: int = 4  # 预处理/识别阶段worker数
+    PIPELINE_AI_WORKERS: int = 16  # AI调用阶段worker数
+    PIPELINE_POSTPROCESS_WORKERS: int = 2  # 后处理阶段worker数
+    PIPELINE_SEND_WORKERS: int = 4  # 发送阶段worker数
+
+    # =============================================================================
+    # 自适应轮询配置
+    # =============================================================================
+    POLL_ADAPTIVE_ON: bool = False  # 是否用自适应轮询替代固定1秒调度
+    POLL_MIN_INTERVAL: float = 0.1  # 空闲退避起始间隔(秒)
+    POLL_MAX_INTERVAL: float = 3.0  # 空闲退避最大间隔(秒)
+    POLL_BACKOFF_FACTOR: float = 2.0  # 退避倍数
+    POLL_OVERRUN_SECONDS: float = 1.0  # 单轮耗时超过该值记为超时
+    SAINIU_POLL_MAX_RATE: float = 20.0  # GetNewNews每秒最大调用次数(<=0不限)
+
+    # =============================================================================
+    # 推送接口队列配置
+    # =============================================================================
+    PUSH_QUEUE_SIZE: int = 500  # 每个worker队列容量
+    PUSH_WORKERS: int = 8  # 推送消息消费worker数
+    PUSH_RETRY_AFTER: int = 2  # 队列满时建议重试间隔(秒)
+
+    # =============================================================================
+    # Redis Streams 消息分发配置
+    # =============================================================================
+    STREAM_ON: bool = False  # 是否通过Redis Stream跨进程分发消息
+    STREAM_CONSUME_ON: bool = True  # 本进程是否参与消费
+    STREAM_KEY: str = "neeko:messages"  # Stream Key前缀
+    STREAM_GROUP: str = "neeko-workers"  # 消费组名称
+    STREAM_PARTITIONS: int = 16  # 分区数(按买家分区)
+    STREAM_MAXLEN: int = 100000  # 每个分区最大长度(近似裁剪)
+    STREAM_BATCH: int = 32  # 每次读取条数
+    STREAM_BLOCK_MS: int = 1000  # 读取阻塞时长(毫秒)
+    STREAM_LEASE_MS: int = 10000  # 分区租约时长(毫秒)
+    STREAM_CLAIM_IDLE_MS: int = 60000  # 未确认消息超过该时长重新处理(毫秒，须大于单条消息最长处理时间)
+
+    # =============================================================================
+    # 定时任务主节点选举配置
+    # =============================================================================
+    LEADER_ELECTION_ON: bool = False  # 是否启用主节点选举(多进程/多副本部署时开启)
+    LEADER_LEASE_MS: int = 5000  # 主节点租约时长(毫秒)
+    LEADER_KEY_PREFIX: str = "neeko:leader"  # 租约Key前缀
+
+    # =============================================================================
+    # 连续消息聚合配置
+    # =============================================================================
+    BURST_ON: bool = False  # 是否合并买家连续消息为一次AI调用
+    BURST_IDLE_SECONDS: float = 3.0  # 买家静默多久后合并处理(秒)
+    BURST_MAX_WAIT: float = 10.0  # 首条消息后最长等待(秒)
+
+    # =============================================================================
+    # 出站消息调度配置
+    # =============================================================================
+    SEND_SCHEDULER_ON: bool = False  # 是否经按账号调度的队列发送回复
+    SEND_RATE: float = 5.0  # 每个客服账号每秒最多发送次数(<=0不限)
+    SEND_BURST: float = 5.0  # 每个客服账号允许的突发发送次数
+    SEND_COALESCE_SECONDS: float = 0.3  # 同一买家回复的合并等待时长(秒)
+    SEND_DEDUP_WINDOW: int = 60  # 相同回复抑制窗口(秒，0为不抑制)
+
+    # =============================================================================
+    # Dify回复缓存配置
+    # =============================================================================
+    ANSWER_CACHE_ON: bool = False  # 是否缓存Dify回复(精确+近似匹配)
+    ANSWER_CACHE_TTL: float = 600.0  # 缓存有效期(秒)
+    ANSWER_CACHE_MAX_ENTRIES: int = 2000  # 最大条目数(LRU淘汰)
+    ANSWER_CACHE_SIMILARITY: float = 0.9  # 近似匹配余弦相似度阈值(>1关闭近似匹配)
+    ANSWER_CACHE_MAX_QUERY_LEN: int = 30  # 超过该长度(归一化后)的问题不缓存
+    ANSWER_CACHE_BYPASS_INTENTS: List[str] = ["transfer", "order"]  # 不走缓存的意图
+
+    # =============================================================================
+    # 本机推理服务配置
+    # =============================================================================
+    INFERENCE_SERVER_ON: bool = False  # 是否经本机推理服务调用YOLO分类/检测及OCR
+    INFERENCE_SOCKET_PATH: str = "/tmp/neeko/inference.sock"  # 推理服务Unix套接字路径
+    INFERENCE_THREADS: int = 4  # 算子内线程数(torch/OpenMP/PaddleOCR)
+    INFERENCE_CPU_AFFINITY: List[int] = []  # 推理服务绑定的CPU核(空为不绑定)
+    INFERENCE_TIMEOUT: float = 30.0  # 单次推理调用超时(秒)
+    INFERENCE_BATCH_SIZE: int = 1  # 分类/检测最大批大小(1为逐张推理，CPU上建议8~16)
+    INFERENCE_BATCH_WAIT_MS: float = 20.0  # 凑批时最早请求的最长等待(毫秒)
+
+    # =============================================================================
+    # 图片下载配置
+    # =============================================================================
+    IMAGE_DOWNLOAD_TIMEOUT: float = 30.0  # 单张图片下载超时(秒)
+    IMAGE_MAX_BYTES: int = 10485760  # 单张图片最大字节数，超过即中止下载
+    IMAGE_MAX_CONNECTIONS: int = 50  # 图片下载连接池最大连接数
+    IMAGE_HOST_CONCURRENCY: int = 8  # 同一域名并发下载上限
+    IMAGE_CDN_RESIZE: int = 0  # 识别时请求淘宝CDN缩放图的边长(0为下载原图，YOLO输入为640)
+
+    # =============================================================================
+    # 图片预处理配置
+    # =============================================================================
+    IMAGE_WORK_MAX_SIDE: int = 1280  # 识别用图长边上限(JPEG按1/2~1/8缩放解码后一次缩放到该尺寸)
+    OCR_ROTATE_MIN_SCORE: float = 0.8  # 无EXIF方向时OCR平均置信度低于该值才尝试旋转
+
+    # =============================================================================
+    # 图片识别结果缓存配置
+    # =============================================================================
+    RECOGNITION_CACHE_ON: bool = False  # 是否按图片URL/内容缓存识别结果
+    RECOGNITION_CACHE_TTL: int = 604800  # 缓存有效期(秒)
+    RECOGNITION_HASH_DISTANCE: int = 6  # 近似匹配的dHash/pHash最大汉明距离(<0关闭近似匹配)
+    RECOGNITION_BAND_CAPACITY: int = 64  # 每个dHash分段索引保留的最新图片数(近似匹配候选上限)
+    RECOGNITION_CACHE_MIN_CONFIDENCE: float = 0.5  # 分类置信度低于该值的结果不缓存
 
     # =============================================================================
     # Celery 配置
@@ -121,6 +305,29 @@ INFO_TYPE_DICT_CN: Dict[int, str] = {
 }
 
 
+# =============================================================================
+# 连续消息聚合类型
+# =============================================================================
+# 参与聚合的消息类型
+BURST_MESSAGE_TYPES: List[str] = ["文本消息", "图片消息", "链接消息"]
+
+# 聚合后的消息类型
+BURST_MERGED_TYPE: str = "合并消息"
+
+
+# =============================================================================
+# 回复缓存意图关键词(按顺序匹配，未命中为other)
+# =============================================================================
+ANSWER_CACHE_INTENT_KEYWORDS: Dict[str, List[str]] = {
+    "transfer": ["退货", "退款", "换货", "发票", "不要了", "人工", "投诉"],
+    "order": ["订单", "单号", "改地址", "修改地址", "取消", "催"],
+    "greeting": ["在吗", "在不在", "你好", "您好"],
+    "stock": ["有货", "现货", "库存", "有没有"],
+    "shipping": ["几天到", "多久到", "发货", "快递", "包邮", "运费"],
+    "price": ["多少钱", "价格", "便宜", "优惠"],
+}
+
+
 # =============================================================================
 # 产品类型映射（中文 -> 英文）
 # =============================================================================
@@ -2,18 +2,81 @@
 API辅助类
 """
 import json
+import time
+from collections import OrderedDict
 import httpx
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from app.redis.redis_client import get_redis_client
+from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
 
 
+# 写入会话ID并顺带清理一批已过期的会话
+_ADD_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[4], 'LIMIT', 0, ARGV[5])
+if #expired > 0 then
+    redis.call('HDEL', KEYS[1], unpack(expired))
+    redis.call('ZREM', KEYS[2], unpack(expired))
+end
+return #expired
+"""
+
+# 清理一批已过期的会话
+_PURGE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #expired > 0 then
+    redis.call('HDEL', KEYS[1], unpack(expired))
+    redis.call('ZREM', KEYS[2], unpack(expired))
+end
+return #expired
+"""
+
+
 class ExpiringArray:
     """
     基于Redis的带过期时间的会话ID存储
     用于管理Dify会话ID
+
+    会话ID集中存放在一个Hash中(field=用户名)，过期时间记录在ZSET索引中，
+    读取全部会话时用HSCAN分批读取，不再使用KEYS；
+    热点买家的会话ID在进程内短期缓存，add时失效
     """
     prefix = "expiring_array:"
+    hash_key = "expiring_array"
+    # 索引Key不能使用prefix前缀，避免与历史的按用户Key(如用户名为deadline)冲突
+    index_key = "expiring_array_index:deadline"
+    purge_batch = 100
+
+    # 进程内缓存: username -> (conversation_id, 缓存到期时间)
+    _local: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+
+    @classmethod
+    def _cache_get(cls, username: str) -> Optional[Any]:
+        """读取进程内缓存"""
+        cached = cls._local.get(username)
+        if cached is None:
+            return None
+        value, expires = cached
+        if expires <= time.monotonic():
+            del cls._local[username]
+            return None
+        cls._local.move_to_end(username)
+        return value
+
+    @classmethod
+    def _cache_set(cls, username: str, value: Any, expire_at: float):
+        """写入进程内缓存(不超过会话本身的过期时间)"""
+        if settings.CONVERSATION_CACHE_TTL <= 0:
+            return
+        ttl = min(settings.CONVERSATION_CACHE_TTL, expire_at - time.time())
+        if ttl <= 0:
+            return
+        cls._local[username] = (value, time.monotonic() + ttl)
+        cls._local.move_to_end(username)
+        while len(cls._local) > settings.CONVERSATION_CACHE_SIZE:
+            cls._local.popitem(last=False)
 
     @classmethod
     async def add(cls, username: str, item: str, expire_time: int = 86400):
@@ -25,10 +88,15 @@ class ExpiringArray:
             item: conversation_id
             expire_time: 过期时间(秒)，默认24小时
         """
+        cls._local.pop(username, None)
         try:
             redis = await get_redis_client()
-            key = f"{cls.prefix}{username}"
-            await redis.setex(key, expire_time, json.dumps(item))
+            now = time.time()
+            await redis.eval(
+                _ADD_SCRIPT, 2, cls.hash_key, cls.index_key,
+                username, json.dumps(item), now + expire_time, now, cls.purge_batch,
+            )
+            cls._cache_set(username, item, now + expire_time)
             logger.debug(f"会话ID已存储: {username} -> {item}")
         except Exception as e:
             logger.error(f"存储会话ID失败: {str(e)}")
@@ -46,31 +114,54 @@ class ExpiringArray:
             conversation_id 或 {username: conversation_id} 字典
         """
         try:
-            redis = await get_redis_client()
-
             if username:
-                # 获取指定用户的会话ID
-                key = f"{cls.prefix}{username}"
-                value = await redis.get(key)
-                if value:
-                    return json.loads(value)
-                return ""
-            else:
-                # 获取所有有效会话
-                pattern = f"{cls.prefix}*"
-                keys = await redis.keys(pattern)
-                result = {}
-                for key in keys:
-                    value = await redis.get(key)
-                    if value:
-                        username = key.replace(cls.prefix, "")
-                        result[username] = json.loads(value)
-                return result
+                return await cls._get_one(username)
+            return await cls._get_all()
 
         except Exception as e:
             logger.error(f"获取会话ID失败: {str(e)}")
             return "" if username else {}
 
+    @classmethod
+    async def _get_one(cls, username: str) -> Any:
+        """获取指定用户的会话ID(一次管道往返，兼容旧版独立Key)"""
+        cached = cls._cache_get(username)
+        if cached is not None:
+            return cached
+
+        redis = await get_redis_client()
+        pipe = redis.pipeline(transaction=False)
+        pipe.hget(cls.hash_key, username)
+        pipe.zscore(cls.index_key, username)
+        pipe.get(f"{cls.prefix}{username}")
+        pipe.ttl(f"{cls.prefix}{username}")
+        value, expire_at, legacy_value, legacy_ttl = await pipe.execute()
+
+        if value and expire_at and expire_at > time.time():
+            item = json.loads(value)
+            cls._cache_set(username, item, expire_at)
+            return item
+
+        if legacy_value:
+            item = json.loads(legacy_value)
+            cls._cache_set(username, item, time.time() + max(legacy_ttl, 0))
+            return item
+
+        return ""
+
+    @classmethod
+    async def _get_all(cls) -> Dict[str, Any]:
+        """获取所有有效会话(先清理过期会话，再HSCAN分批读取)"""
+        redis = await get_redis_client()
+        now = time.time()
+        while await redis.eval(_PURGE_SCRIPT, 2, cls.hash_key, cls.index_key, now, cls.purge_batch):
+            pass
+
+        result = {}
+        async for username, value in redis.hscan_iter(cls.hash_key, count=500):
+            result[username] = json.loads(value)
+        return result
+
 
 class APIHelper:
     """
@@ -0,0 +1,64 @@
+"""
+消息处理截止时间
+
+消息接入时按MESSAGE_BUDGET_SECONDS设置截止时间(与trace_id一起随消息传递，
+跨进程使用墙钟时间)，处理期间通过上下文变量传给下游调用，
+各调用的超时取其默认超时与剩余预算中的较小值。
+"""
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from app.common.config.chatwork_config import settings
+
+# 当前消息的截止时间(时间戳)，不在消息处理上下文中时为None
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """消息处理预算已用完"""
+
+
+def attach_deadline(data: Dict[str, Any]) -> Optional[float]:
+    """
+    消息接入时设置trace_id及截止时间(已设置时保持不变)
+
+    Args:
+        data: 消息数据
+
+    Returns:
+        截止时间，未启用时返回None
+    """
+    data.setdefault("trace_id", str(uuid.uuid4()))
+    if not settings.MESSAGE_DEADLINE_ON:
+        return None
+    return data.setdefault("deadline", time.time() + settings.MESSAGE_BUDGET_SECONDS)
+
+
+def remaining_seconds() -> Optional[float]:
+    """当前消息剩余预算(秒)，不在消息处理上下文中时返回None"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def budget_timeout(default: float) -> float:
+    """
+    按剩余预算计算本次调用的超时
+
+    Args:
+        default: 调用默认超时(秒)
+
+    Returns:
+        超时时间(秒)
+
+    Raises:
+        DeadlineExceeded: 预算已用完
+    """
+    remaining = remaining_seconds()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return min(default, remaining)
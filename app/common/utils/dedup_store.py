@@ -0,0 +1,239 @@
+"""
+消息去重存储
+
+- key: 每条消息一个独立Key(SET NX EX)，与历史数据兼容
+- hash: 按时间分桶的Hash，每桶一个Key，字段为消息指纹，避免海量小Key
+- bloom: 按时间分桶轮换的Bloom过滤器(位图)，内存最小，存在极低误判率
+"""
+import hashlib
+import math
+import time
+from typing import Any, Dict, List
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.redis.redis_client import get_redis_client
+
+# 检查历史分桶，未命中时写入当前分桶
+_HASH_MARK_SCRIPT = """
+local field = ARGV[1]
+for i = 2, #KEYS do
+    if redis.call('HEXISTS', KEYS[i], field) == 1 then
+        return 0
+    end
+end
+local added = redis.call('HSETNX', KEYS[1], field, 1)
+if added == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return added
+"""
+
+# 任一分桶中所有位均已置位视为重复，否则在当前分桶置位
+_BLOOM_MARK_SCRIPT = """
+local ttl = table.remove(ARGV, 1)
+for i = 1, #KEYS do
+    local hit = 1
+    for j = 1, #ARGV do
+        if redis.call('GETBIT', KEYS[i], ARGV[j]) == 0 then
+            hit = 0
+            break
+        end
+    end
+    if hit == 1 then
+        return 0
+    end
+end
+for j = 1, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[j], 1)
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+
+def fingerprint(dedup_key: str) -> str:
+    """消息指纹(16位十六进制)"""
+    return hashlib.blake2b(dedup_key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class KeyDedupStore:
+    """每条消息一个独立Key"""
+
+    name = "key"
+
+    async def mark_many(self, dedup_keys: List[str]) -> List[bool]:
+        """
+        批量检查并标记(一次管道往返)
+
+        Args:
+            dedup_keys: 去重Key列表
+
+        Returns:
+            True表示新消息
+        """
+        redis = await get_redis_client()
+        pipe = redis.pipeline(transaction=False)
+        for dedup_key in dedup_keys:
+            pipe.set(dedup_key, "1", nx=True, ex=settings.DEDUP_TTL)
+        return [bool(result) for result in await pipe.execute()]
+
+    async def release(self, dedup_key: str):
+        """撤销标记"""
+        redis = await get_redis_client()
+        await redis.delete(dedup_key)
+
+
+class BucketDedupStore:
+    """按时间分桶的去重存储基类"""
+
+    prefix = ""
+
+    @property
+    def bucket_seconds(self) -> int:
+        return settings.DEDUP_BUCKET_SECONDS
+
+    def bucket_keys(self, now: float) -> List[str]:
+        """当前分桶在前，其后为仍在TTL内的历史分桶"""
+        current = int(now // self.bucket_seconds)
+        count = math.ceil(settings.DEDUP_TTL / self.bucket_seconds) + 1
+        return [f"{self.prefix}:{current - i}" for i in range(count)]
+
+    @property
+    def bucket_ttl(self) -> int:
+        return settings.DEDUP_TTL + self.bucket_seconds
+
+
+class HashDedupStore(BucketDedupStore):
+    """按时间分桶的Hash"""
+
+    name = "hash"
+    prefix = "dedup"
+
+    async def mark_many(self, dedup_keys: List[str]) -> List[bool]:
+        redis = await get_redis_client()
+        script = redis.register_script(_HASH_MARK_SCRIPT)
+        keys = self.bucket_keys(time.time())
+        pipe = redis.pipeline(transaction=False)
+        for dedup_key in dedup_keys:
+            await script(keys=keys, args=[fingerprint(dedup_key), self.bucket_ttl], client=pipe)
+        return [bool(result) for result in await pipe.execute()]
+
+    async def release(self, dedup_key: str):
+        # 标记后可能已轮换到新分桶，从所有仍有效的分桶中删除
+        redis = await get_redis_client()
+        field = fingerprint(dedup_key)
+        pipe = redis.pipeline(transaction=False)
+        for key in self.bucket_keys(time.time()):
+            pipe.hdel(key, field)
+        await pipe.execute()
+
+
+class BloomDedupStore(BucketDedupStore):
+    """按时间分桶轮换的Bloom过滤器"""
+
+    name = "bloom"
+    prefix = "dedup_bloom"
+
+    @property
+    def bits(self) -> int:
+        """位图大小 m = -n·ln(p) / ln(2)²"""
+        n = settings.DEDUP_BLOOM_CAPACITY
+        p = settings.DEDUP_BLOOM_ERROR_RATE
+        return int(math.ceil(-n * math.log(p) / (math.log(2) ** 2)))
+
+    @property
+    def hashes(self) -> int:
+        """哈希函数个数 k = m/n·ln(2)"""
+        return max(1, round(self.bits / settings.DEDUP_BLOOM_CAPACITY * math.log(2)))
+
+    def positions(self, dedup_key: str) -> List[int]:
+        """双重哈希计算k个位偏移"""
+        digest = hashlib.blake2b(dedup_key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    async def mark_many(self, dedup_keys: List[str]) -> List[bool]:
+        redis = await get_redis_client()
+        script = redis.register_script(_BLOOM_MARK_SCRIPT)
+        keys = self.bucket_keys(time.time())
+        pipe = redis.pipeline(transaction=False)
+        for dedup_key in dedup_keys:
+            await script(keys=keys, args=[self.bucket_ttl, *self.positions(dedup_key)], client=pipe)
+        return [bool(result) for result in await pipe.execute()]
+
+    async def release(self, dedup_key: str):
+        # Bloom过滤器无法删除单个元素
+        logger.warning(f"Bloom去重不支持撤销标记: {dedup_key}")
+
+
+_STORES = {store.name: store for store in (KeyDedupStore(), HashDedupStore(), BloomDedupStore())}
+
+
+def get_dedup_store():
+    """按配置获取去重存储"""
+    return _STORES.get(settings.DEDUP_BACKEND, _STORES["key"])
+
+
+# 单条记录内存估算(字节，64位Redis + jemalloc)
+# key: 主字典dictEntry(24) + Key的sds + 过期字典dictEntry(24) + 哈希桶指针(8×1.33)
+# hash: dictEntry(24) + 字段sds(16位指纹→24) + 值sds(8) + 哈希桶指针(8×1.33)
+_KEY_ENTRY_OVERHEAD = 24 + 24 + 11
+_HASH_ENTRY_BYTES = 24 + 24 + 8 + 11
+
+
+def _jemalloc_size(size: int) -> int:
+    """jemalloc小对象分配尺寸"""
+    for bin_size in (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256):
+        if size <= bin_size:
+            return bin_size
+    return size
+
+
+async def dedup_memory_report(sample_key: str = "t_1514353800520_0314_cntaobao:shop:staff_1700000000000") -> Dict[str, Any]:
+    """
+    去重存储内存报告: 各方案每百万条消息的估算字节数，以及当前分桶的实测占用
+
+    Args:
+        sample_key: 用于估算的典型去重Key
+
+    Returns:
+        报告数据
+    """
+    million = 1_000_000
+    bloom = _STORES["bloom"]
+    key_bytes = _KEY_ENTRY_OVERHEAD + _jemalloc_size(len(sample_key) + 3)
+    bloom_bits_per_message = bloom.bits / settings.DEDUP_BLOOM_CAPACITY
+
+    report: Dict[str, Any] = {
+        "backend": settings.DEDUP_BACKEND,
+        "estimated_bytes_per_million": {
+            "key": key_bytes * million,
+            "hash": _HASH_ENTRY_BYTES * million,
+            "bloom": int(bloom_bits_per_message / 8 * million),
+        },
+        "bloom": {
+            "capacity": settings.DEDUP_BLOOM_CAPACITY,
+            "error_rate": settings.DEDUP_BLOOM_ERROR_RATE,
+            "bits": bloom.bits,
+            "hashes": bloom.hashes,
+        },
+        "buckets": {},
+    }
+
+    # 实测当前分桶占用
+    store = get_dedup_store()
+    if isinstance(store, BucketDedupStore):
+        redis = await get_redis_client()
+        for key in store.bucket_keys(time.time()):
+            usage = await redis.memory_usage(key)
+            if usage is None:
+                continue
+            bucket = {"bytes": usage}
+            if isinstance(store, HashDedupStore):
+                count = await redis.hlen(key)
+                bucket["messages"] = count
+                bucket["bytes_per_million"] = int(usage / count * million) if count else None
+            report["buckets"][key] = bucket
+
+    return report
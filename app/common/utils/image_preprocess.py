@@ -0,0 +1,150 @@
+"""
+图片识别预处理
+
+手机拍摄的铭牌照片多为1200万像素，全尺寸解码、裁剪、旋转后逐次OCR的CPU与内存开销很大:
+- 只读取图片头部获得尺寸和EXIF方向，不解码像素
+- JPEG按DCT缩放直接解码为1/2、1/4、1/8尺寸，再一次性缩放到IMAGE_WORK_MAX_SIDE以内
+- 按EXIF方向在缩小后的图上旋转/翻转
+- ROI为同一解码缓冲区上的NumPy视图，不复制像素
+"""
+import io
+from typing import Any, Optional, Sequence, Tuple
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+
+# EXIF方向标签
+_ORIENTATION_TAG = 0x0112
+
+# JPEG缩放解码倍数(由大到小尝试)
+_REDUCE_FACTORS = (8, 4, 2)
+
+
+class PreparedImage:
+    """预处理后的图片"""
+
+    __slots__ = ("array", "oriented")
+
+    def __init__(self, array: Any, oriented: bool):
+        """
+        Args:
+            array: BGR图像数组(已按EXIF方向摆正)
+            oriented: 是否带EXIF方向信息(无EXIF方向时OCR低置信度才尝试旋转)
+        """
+        self.array = array
+        self.oriented = oriented
+
+
+def read_header(content: bytes) -> Tuple[Optional[Tuple[int, int]], Optional[int]]:
+    """
+    读取图片尺寸及EXIF方向(只解析头部，不解码像素)
+
+    Args:
+        content: 图片字节
+
+    Returns:
+        ((宽, 高)或None, EXIF方向或None)
+    """
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(content)) as image:
+            orientation = image.getexif().get(_ORIENTATION_TAG)
+            return image.size, orientation if orientation in range(1, 9) else None
+    except Exception as e:
+        logger.debug(f"读取图片头部失败: {str(e)}")
+        return None, None
+
+
+def apply_orientation(image: Any, orientation: Optional[int]) -> Any:
+    """
+    按EXIF方向摆正图片
+
+    Args:
+        image: BGR图像数组
+        orientation: EXIF方向(1~8)
+
+    Returns:
+        摆正后的图像数组
+    """
+    import cv2
+
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(image), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def prepare_image(content: bytes, max_side: Optional[int] = None) -> PreparedImage:
+    """
+    图片字节解码为识别用的BGR数组(在线程中执行)
+
+    Args:
+        content: 图片字节
+        max_side: 长边上限，默认IMAGE_WORK_MAX_SIDE
+
+    Returns:
+        预处理后的图片
+
+    Raises:
+        ValueError: 无法解码
+    """
+    import cv2
+    import numpy as np
+
+    max_side = max_side or settings.IMAGE_WORK_MAX_SIDE
+    size, orientation = read_header(content)
+
+    # 选择缩小后长边仍不小于max_side的最大解码倍数
+    flags = cv2.IMREAD_COLOR
+    if size:
+        long_side = max(size)
+        for factor in _REDUCE_FACTORS:
+            if long_side // factor >= max_side:
+                flags = getattr(cv2, f"IMREAD_REDUCED_COLOR_{factor}")
+                break
+
+    # EXIF方向由本模块在缩小后的图上处理
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        raise ValueError("图片解码失败")
+
+    height, width = image.shape[:2]
+    if max(height, width) > max_side:
+        ratio = max_side / max(height, width)
+        image = cv2.resize(
+            image,
+            (max(1, round(width * ratio)), max(1, round(height * ratio))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    image = apply_orientation(image, orientation)
+    return PreparedImage(image, orientation is not None)
+
+
+def crop_roi(image: Any, box: Sequence[float], padding: int = 0) -> Any:
+    """
+    按检测框裁剪ROI(返回原数组上的视图，不复制像素)
+
+    Args:
+        image: BGR图像数组
+        box: 检测框(x1, y1, x2, y2)
+        padding: 四周外扩像素
+
+    Returns:
+        ROI视图
+    """
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = (int(value) for value in box)
+    x1, y1 = max(0, x1 - padding), max(0, y1 - padding)
+    x2, y2 = min(width, x2 + padding), min(height, y2 + padding)
+    return image[y1:y2, x1:x2]
@@ -1,11 +1,140 @@
 """
 图片下载工具
+
+图片经共享连接池流式下载到内存(超过IMAGE_MAX_BYTES即中止)，由image_preprocess直接解码，
+不经临时文件；同一域名的并发下载数受IMAGE_HOST_CONCURRENCY限制。
 """
+import asyncio
 import os
+import re
 import uuid
 import httpx
 from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
+from app.common.utils.deadline import budget_timeout
+
+# 淘宝图片CDN域名(同一路径在这些域名下为同一张图)
+_TAOBAO_CDN_HOSTS = {"img.alicdn.com", "gw.alicdn.com", "gd1.alicdn.com", "gd2.alicdn.com",
+                     "gd3.alicdn.com", "gd4.alicdn.com"}
+_TAOBAO_CANONICAL_HOST = "img.alicdn.com"
+
+# 淘宝CDN尺寸/质量/格式后缀，如 xxx.jpg_400x400q90.jpg_.webp、xxx.png_sum.jpg
+_TAOBAO_SUFFIX_PATTERN = re.compile(r"(\.(?:jpe?g|png|gif|webp|bmp))_[^/]*$", re.IGNORECASE)
+
+
+def canonical_image_url(url: str) -> str:
+    """
+    图片URL规范化: 淘宝CDN图片统一协议和域名，去掉尺寸后缀及查询参数，
+    同一张原图的不同缩略图URL得到相同结果
+
+    Args:
+        url: 图片URL
+
+    Returns:
+        规范化后的URL，非淘宝CDN图片原样返回
+    """
+    url = (url or "").strip()
+    if url.startswith("//"):
+        url = f"https:{url}"
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host not in _TAOBAO_CDN_HOSTS:
+        return url
+    path = _TAOBAO_SUFFIX_PATTERN.sub(r"\1", parts.path)
+    return urlunsplit(("https", _TAOBAO_CANONICAL_HOST, path, "", ""))
+
+
+def resized_image_url(url: str, size: int) -> str:
+    """
+    淘宝CDN缩放图URL(按比例缩放至size x size以内)，节省下载带宽与解码时间
+
+    Args:
+        url: 图片URL
+        size: 目标边长(<=0不缩放)
+
+    Returns:
+        缩放图URL，非淘宝CDN图片或不缩放时返回原URL
+    """
+    canonical = canonical_image_url(url)
+    if size <= 0 or urlsplit(canonical).hostname != _TAOBAO_CANONICAL_HOST:
+        return url
+    return f"{canonical}_{size}x{size}.jpg"
+
+
+# 图片下载连接池(各域名共享)
+http_client: Optional[httpx.AsyncClient] = None
+
+# 各域名并发下载限制
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+async def get_image_http_client() -> httpx.AsyncClient:
+    """获取图片下载连接池客户端(未初始化时自动创建)"""
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=settings.IMAGE_DOWNLOAD_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=settings.IMAGE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.IMAGE_MAX_CONNECTIONS,
+            ),
+        )
+        logger.info("图片下载连接池已创建")
+    return http_client
+
+
+async def close_image_http_client():
+    """关闭图片下载连接池客户端"""
+    global http_client
+    if http_client:
+        await http_client.aclose()
+        http_client = None
+        logger.info("图片下载连接池已关闭")
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    """域名并发下载限制"""
+    host = (urlsplit(url).hostname or "").lower()
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(settings.IMAGE_HOST_CONCURRENCY)
+    return limit
+
+
+async def fetch_image_bytes(url: str, max_bytes: Optional[int] = None) -> bytes:
+    """
+    流式下载图片到内存
+
+    Args:
+        url: 图片URL
+        max_bytes: 最大字节数，默认IMAGE_MAX_BYTES
+
+    Returns:
+        图片字节
+
+    Raises:
+        ValueError: 图片超过最大字节数
+    """
+    max_bytes = max_bytes or settings.IMAGE_MAX_BYTES
+    client = await get_image_http_client()
+    async with _host_limit(url):
+        timeout = budget_timeout(settings.IMAGE_DOWNLOAD_TIMEOUT)
+        async with client.stream("GET", url, timeout=timeout) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get("content-length") or 0)
+            if declared > max_bytes:
+                raise ValueError(f"图片过大: {declared} > {max_bytes}")
+
+            buffer = bytearray()
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+                if len(buffer) > max_bytes:
+                    raise ValueError(f"图片过大: 超过{max_bytes}字节")
+    return bytes(buffer)
 
 
 async def download_image(url: str, save_dir: str = "/tmp/images/") -> str:
@@ -28,14 +157,9 @@ async def download_image(url: str, save_dir: str = "/tmp/images/") -> str:
         filename = f"{uuid.uuid4()}.{ext}"
         filepath = os.path.join(save_dir, filename)
 
-        # 下载图片
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-
-            # 保存文件
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+        # 下载图片并在线程中写入文件
+        content = await fetch_image_bytes(url)
+        await asyncio.to_thread(Path(filepath).write_bytes, content)
 
         logger.info(f"图片下载成功: {filepath}")
         return filepath
@@ -5,70 +5,170 @@ YOLO + PaddleOCR 特征提取模块
 - best.pt (检测模型)
 放置路径: app/common/models/best.pt
 
-当前为占位实现,返回模拟结果
+模型文件不存在时为占位实现,返回模拟结果。
+启用INFERENCE_SERVER_ON时由本机推理服务统一加载模型，各进程经Unix套接字调用。
 """
-import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, List, Tuple
+import numpy as np
+from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
+from app.common.utils.image_preprocess import crop_roi
+from app.common.utils.micro_batch import MicroBatcher
 from app.common.utils.rule import YoloRuleC
 
 # 模型文件路径
 BASE_PATH = Path(__file__).resolve().parent.parent
 MODEL_PATH = BASE_PATH / "models" / "best.pt"
 
+# 占位识别结果
+PLACEHOLDER_MODEL = "DZ120V1D"
+
+# 进程内模型(首次使用时加载)
+_detector = None
+_ocr = None
+
+
+def load_models():
+    """
+    加载YOLO检测模型与PaddleOCR(每个进程只加载一次)
+
+    Returns:
+        (检测模型, OCR实例)，模型文件不存在时返回(None, None)
+    """
+    global _detector, _ocr
+    if _detector is None and MODEL_PATH.exists():
+        from ultralytics import YOLO
+        from paddleocr import PaddleOCR
+        _detector = YOLO(str(MODEL_PATH))
+        _ocr = PaddleOCR(
+            lang="en",
+            use_gpu=False,
+            use_angle_cls=True,
+            show_log=False,
+            cpu_threads=settings.INFERENCE_THREADS,
+        )
+        logger.info(f"YOLO检测模型及PaddleOCR已加载: {MODEL_PATH}")
+    return _detector, _ocr
+
 
 class OrcTextExtraction:
     """OCR文本提取类"""
 
     @staticmethod
-    async def yolo_ocr(image: str) -> str:
+    def _read_text(ocr, roi: Any, oriented: bool) -> str:
+        """
+        ROI文字识别；无EXIF方向且置信度低时依次尝试旋转90/180/270度，取置信度最高的结果
+
+        Args:
+            ocr: PaddleOCR实例
+            roi: ROI图像数组
+            oriented: 图片是否已按EXIF方向摆正
+
+        Returns:
+            识别文本
+        """
+        best_text, best_score = "", -1.0
+        candidates = [roi]
+        if not oriented:
+            candidates += [np.rot90(roi, k) for k in (3, 2, 1)]
+
+        for candidate in candidates:
+            lines = ocr.ocr(np.ascontiguousarray(candidate), cls=True)[0] or []
+            if lines:
+                score = float(np.mean([line[1][1] for line in lines]))
+                if score > best_score:
+                    best_text, best_score = "".join(line[1][0] for line in lines), score
+            if best_score >= settings.OCR_ROTATE_MIN_SCORE:
+                break
+        return best_text
+
+    @staticmethod
+    def extract_batch(items: List[Tuple[Any, bool]]) -> List[str]:
+        """
+        同步执行YOLO目标检测(批量前向计算) + PaddleOCR识别
+
+        Args:
+            items: (图片路径或BGR图像数组, 是否已按EXIF方向摆正) 列表
+
+        Returns:
+            各图片识别出的产品型号，未检测到标签为空字符串
+        """
+        detector, ocr = load_models()
+        if detector is None:
+            texts = [PLACEHOLDER_MODEL] * len(items)
+        else:
+            # 1. YOLO批量检测标签区域
+            images = [image for image, _ in items]
+            results = detector(images, conf=0.7, iou=0.5, max_det=1, verbose=False)
+
+            texts = []
+            for (image, oriented), result in zip(items, results):
+                if not len(result.boxes):
+                    texts.append("")
+                    continue
+
+                # 2. 裁剪ROI区域(解码缓冲区上的视图)
+                source = image if isinstance(image, np.ndarray) else result.orig_img
+                roi = crop_roi(source, result.boxes.xyxy[0].tolist())
+
+                # 3. OCR识别，必要时尝试旋转
+                texts.append(OrcTextExtraction._read_text(ocr, roi, oriented))
+
+        # 4. OCR纠错及数据清洗
+        return [
+            YoloRuleC.data_cleaning(YoloRuleC.th_rule(text)) if text else ""
+            for text in texts
+        ]
+
+    @staticmethod
+    def extract(image: Any, oriented: bool = False) -> str:
+        """
+        同步执行YOLO目标检测 + PaddleOCR识别
+
+        Args:
+            image: 图片路径或BGR图像数组
+            oriented: 图片是否已按EXIF方向摆正
+
+        Returns:
+            识别出的产品型号，未检测到标签返回空字符串
+        """
+        return OrcTextExtraction.extract_batch([(image, oriented)])[0]
+
+    @staticmethod
+    async def yolo_ocr(image: Any, oriented: bool = False) -> str:
         """
         YOLO目标检测 + PaddleOCR识别
 
         Args:
-            image: 图片路径
+            image: 图片路径或BGR图像数组
+            oriented: 图片是否已按EXIF方向摆正(是则不尝试旋转)
 
         Returns:
             识别出的产品型号,如"DZ120V1D"
         """
         try:
-            # 检查模型文件是否存在
-            if not MODEL_PATH.exists():
-                logger.warning(f"YOLO检测模型不存在: {MODEL_PATH}")
-                logger.warning("使用占位实现,返回模拟结果")
-                # 占位：返回一个示例型号
-                return "DZ120V1D"
-
-            # TODO: 实际YOLO检测 + OCR实现
-            # 1. YOLO检测目标区域
-            # from ultralytics import YOLO
-            # model = YOLO(str(MODEL_PATH))
-            # results = model(image, conf=0.7, iou=0.5, max_det=1)
-
-            # 2. 裁剪ROI区域
-            # 3. 判断图片方向并旋转
-            # 4. 多方法OCR识别
-            # from paddleocr import PaddleOCR
-            # ocr = PaddleOCR(lang='en', use_gpu=False)
-            # result = ocr.ocr(roi_image)
-
-            # 5. 数据清洗
-            # text_res = YoloRuleC.data_cleaning(ocr_text)
-
-            # 6. OCR纠错
-            # text_res = YoloRuleC.th_rule(text_res)
-
-            # 占位实现
-            text_res = "DZ120V1D"
-            logger.info(f"OCR识别(占位): {image} -> {text_res}")
-
-            # 应用纠错规则
-            text_res = YoloRuleC.th_rule(text_res)
-            text_res = YoloRuleC.data_cleaning(text_res)
-
+            if settings.INFERENCE_SERVER_ON:
+                from app.services.inference import inference_client
+                text_res = await inference_client.yolo_ocr(image, oriented)
+            else:
+                if not MODEL_PATH.exists():
+                    logger.warning(f"YOLO检测模型不存在: {MODEL_PATH}，使用占位实现")
+                text_res = await ocr_batcher.submit((image, oriented))
+
+            source = image if isinstance(image, str) else f"array{getattr(image, 'shape', '')}"
+            logger.info(f"OCR识别: {source} -> {text_res}")
             return text_res
 
         except Exception as e:
             logger.error(f"OCR识别失败: {str(e)}")
             return ""
+
+
+# 检测+OCR请求微批队列(本进程推理时使用，推理服务内也经此队列合批)
+ocr_batcher = MicroBatcher(
+    "yolo_ocr",
+    OrcTextExtraction.extract_batch,
+    max_batch=settings.INFERENCE_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_BATCH_WAIT_MS,
+)
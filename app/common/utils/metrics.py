@@ -0,0 +1,109 @@
+"""
+运行指标统计工具
+"""
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, Any, List
+
+
+class ThroughputCounter:
+    """
+    滑动窗口吞吐量计数器
+    按秒分桶记录处理数量，用于统计每秒处理消息数
+    """
+
+    def __init__(self, window: int = 60):
+        """
+        初始化计数器
+
+        Args:
+            window: 统计窗口(秒)
+        """
+        self.window = window
+        self.total = 0
+        self._buckets: Deque[List[int]] = deque()  # [秒级时间戳, 数量]
+
+    def record(self, count: int = 1):
+        """
+        记录处理数量
+
+        Args:
+            count: 本次处理数量
+        """
+        now = int(time.time())
+        self.total += count
+
+        if self._buckets and self._buckets[-1][0] == now:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([now, count])
+
+        self._trim(now)
+
+    def rate(self) -> float:
+        """
+        获取窗口内平均每秒处理数量
+
+        Returns:
+            每秒处理数量
+        """
+        self._trim(int(time.time()))
+        count = sum(bucket[1] for bucket in self._buckets)
+        return round(count / self.window, 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取当前统计快照"""
+        return {
+            "total": self.total,
+            "per_second": self.rate(),
+            "window": self.window,
+        }
+
+    def _trim(self, now: int):
+        """移除窗口外的分桶"""
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+
+class Histogram:
+    """
+    固定分桶直方图
+    各分桶记录落在(上一分桶上限, 本分桶上限]内的样本数
+    """
+
+    def __init__(self, buckets: List[float]):
+        """
+        初始化直方图
+
+        Args:
+            buckets: 分桶上限(升序)
+        """
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, value: float):
+        """
+        记录一个样本
+
+        Args:
+            value: 样本值
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取当前统计快照"""
+        labels = [f"<={bucket:g}" for bucket in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 2) if self.count else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+# 全局消息吞吐量计数器
+message_throughput = ThroughputCounter()
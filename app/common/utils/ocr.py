@@ -5,17 +5,104 @@ YOLO图片分类模块
 - classify.pt (分类模型)
 放置路径: app/common/models/classify.pt
 
-当前为占位实现,返回模拟结果
+模型文件不存在时为占位实现,返回模拟结果。
+启用INFERENCE_SERVER_ON时由本机推理服务(app.services.inference_server)统一加载模型，
+各进程经Unix套接字调用，不在本进程加载模型。
 """
-import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, List, Optional, Tuple
+from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
+from app.common.utils.micro_batch import MicroBatcher
 
 # 模型文件路径
 BASE_PATH = Path(__file__).resolve().parent.parent
 MODEL_PATH = BASE_PATH / "models" / "classify.pt"
 
+# 占位分类结果
+PLACEHOLDER_CLASS = "Compressor"
+
+# 进程内模型(首次使用时加载)
+_model = None
+
+
+def load_model():
+    """
+    加载YOLO分类模型(每个进程只加载一次)
+
+    Returns:
+        模型实例，模型文件不存在时返回None
+    """
+    global _model
+    if _model is None and MODEL_PATH.exists():
+        from ultralytics import YOLO
+        _model = YOLO(str(MODEL_PATH))
+        logger.info(f"YOLO分类模型已加载: {MODEL_PATH}")
+    return _model
+
+
+def predict_batch(images: List[Any]) -> List[Tuple[str, float]]:
+    """
+    同步执行批量分类推理(一次前向计算)
+
+    Args:
+        images: 图片路径或BGR图像数组列表
+
+    Returns:
+        各图片的(分类结果, 置信度)，占位实现置信度为0
+    """
+    model = load_model()
+    if model is None:
+        return [(PLACEHOLDER_CLASS, 0.0)] * len(images)
+    results = model(list(images), verbose=False)
+    return [(result.names[result.probs.top1], float(result.probs.top1conf)) for result in results]
+
+
+def predict(image: Any) -> Tuple[str, float]:
+    """
+    同步执行分类推理
+
+    Args:
+        image: 图片路径或BGR图像数组
+
+    Returns:
+        (分类结果, 置信度)，占位实现置信度为0
+    """
+    return predict_batch([image])[0]
+
+
+# 分类请求微批队列(本进程推理时使用，推理服务内也经此队列合批)
+classify_batcher = MicroBatcher(
+    "classify",
+    predict_batch,
+    max_batch=settings.INFERENCE_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_BATCH_WAIT_MS,
+)
+
+
+async def classify_with_confidence(image: Any) -> Optional[Tuple[str, float]]:
+    """
+    YOLO图片分类(带置信度)
+
+    Args:
+        image: 图片路径或BGR图像数组
+
+    Returns:
+        (分类结果, 置信度)，失败返回None
+    """
+    try:
+        if settings.INFERENCE_SERVER_ON:
+            from app.services.inference import inference_client
+            return await inference_client.classify(image)
+
+        if not MODEL_PATH.exists():
+            logger.warning(f"YOLO分类模型不存在: {MODEL_PATH}，使用占位实现")
+        return await classify_batcher.submit(image)
+
+    except Exception as e:
+        logger.error(f"图片分类失败: {str(e)}")
+        return None
+
 
 async def classify(
     image_path: str,
@@ -34,25 +121,10 @@ async def classify(
         分类结果(英文),如"Compressor"、"Mainboard"等
         失败返回None
     """
-    try:
-        # 检查模型文件是否存在
-        if not MODEL_PATH.exists():
-            logger.warning(f"YOLO分类模型不存在: {MODEL_PATH}")
-            logger.warning("使用占位实现,返回模拟结果")
-            # 占位：返回Compressor作为示例
-            return "Compressor"
-
-        # TODO: 实际YOLO分类实现
-        # from ultralytics import YOLO
-        # model = YOLO(str(MODEL_PATH))
-        # results = model(image_path)
-        # class_name = results[0].names[results[0].probs.top1]
-        # return class_name
-
-        # 占位实现
-        logger.info(f"图片分类(占位): {image_path} -> Compressor")
-        return "Compressor"
-
-    except Exception as e:
-        logger.error(f"图片分类失败: {str(e)}")
+    result = await classify_with_confidence(image_path)
+    if result is None:
         return None
+
+    class_name, confidence = result
+    logger.info(f"图片分类: {image_path} -> {class_name} ({confidence:.2f})")
+    return class_name
@@ -0,0 +1,122 @@
+"""
+限流工具
+"""
+import asyncio
+import random
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    令牌桶限流器
+    rate<=0 表示不限流
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒生成令牌数
+            capacity: 桶容量(允许的突发数量)，默认等于rate且至少为1
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        """按流逝时间补充令牌"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        尝试获取令牌(不等待)
+
+        Args:
+            tokens: 需要的令牌数
+
+        Returns:
+            True表示获取成功
+        """
+        if self.rate <= 0:
+            return True
+
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        """
+        获取令牌(不足时等待)
+
+        Args:
+            tokens: 需要的令牌数
+        """
+        while not self.try_acquire(tokens):
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class RetryBudget:
+    """
+    重试预算: 每次请求存入ratio个令牌，每次重试消耗1个令牌，
+    使重试量不超过请求量的ratio比例(另有每秒min_per_second的保底)，
+    下游故障时不会放大成重试风暴
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = 100.0):
+        """
+        初始化重试预算
+
+        Args:
+            ratio: 每次请求可产生的重试额度
+            min_per_second: 每秒保底重试次数
+            max_tokens: 最大累积额度
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self._floor = TokenBucket(min_per_second)
+
+        # 统计数据
+        self.retries = 0
+        self.exhausted = 0
+
+    def deposit(self):
+        """记录一次请求"""
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """
+        尝试获取一次重试额度
+
+        Returns:
+            True表示允许重试
+        """
+        if self.tokens >= 1:
+            self.tokens -= 1
+        elif self._floor.rate <= 0 or not self._floor.try_acquire():
+            self.exhausted += 1
+            return False
+        self.retries += 1
+        return True
+
+
+def jittered_backoff(attempt: int, base: float, cap: float) -> float:
+    """
+    指数退避(全抖动)
+
+    Args:
+        attempt: 第几次重试(从0开始)
+        base: 基础间隔(秒)
+        cap: 最大间隔(秒)
+
+    Returns:
+        等待时长(秒)
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
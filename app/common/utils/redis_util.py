@@ -1,15 +1,37 @@
 """
 Redis工具函数
 """
+import json
+import time
 from typing import Optional, Dict, Any, List
 from app.redis.redis_client import get_redis_client
+from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
+from app.common.utils.dedup_store import get_dedup_store
 from app.common.utils.datetime_u import get_current_date_str
 
 
+def get_dedup_key(res_data: Dict[str, Any]) -> str:
+    """
+    生成消息去重Key
+    启用DEDUP_BY_MESSAGE_ID且消息带有messageId时按messageId去重
+
+    Args:
+        res_data: 赛牛消息数据
+    """
+    message_id = res_data.get("messageId", "")
+    if settings.DEDUP_BY_MESSAGE_ID and message_id:
+        return f"msg_{message_id}"
+
+    buyer_uid = res_data.get("buyerUid", "")
+    login_id = res_data.get("loginId", "")
+    timestamp = res_data.get("time", "")
+    return f"{buyer_uid}_{login_id}_{timestamp}"
+
+
 async def handle_sainiu_message(res_data: Dict[str, Any]) -> bool:
     """
-    消息去重处理
+    消息去重处理(原子检查并标记)
 
     Args:
         res_data: 赛牛消息数据
@@ -18,90 +40,209 @@ async def handle_sainiu_message(res_data: Dict[str, Any]) -> bool:
         True表示新消息可处理，False表示重复消息跳过
     """
     try:
-        redis = await get_redis_client()
-        buyer_uid = res_data.get("buyerUid", "")
-        login_id = res_data.get("loginId", "")
-        timestamp = res_data.get("time", "")
-
-        # 生成去重Key
-        dedup_key = f"{buyer_uid}_{login_id}_{timestamp}"
+        dedup_key = get_dedup_key(res_data)
+        if (await get_dedup_store().mark_many([dedup_key]))[0]:
+            return True
 
-        # 检查是否存在
-        exists = await redis.exists(dedup_key)
-        if exists:
-            logger.info(f"重复消息被过滤: {dedup_key}")
-            return False
-
-        # 写入Redis，TTL 24小时
-        await redis.setex(dedup_key, 86400, "1")
-        return True
+        logger.info(f"重复消息被过滤: {dedup_key}")
+        return False
 
     except Exception as e:
         logger.error(f"消息去重处理失败: {str(e)}")
         return True  # 出错时默认允许处理
 
 
-async def set_active_user(user_key: str, ttl: int = 20):
+async def handle_sainiu_messages(res_data_list: List[Dict[str, Any]]) -> List[bool]:
     """
-    设置活跃用户标记
+    批量消息去重(一次管道往返)
 
     Args:
-        user_key: 用户标识
-        ttl: 过期时间(秒)
+        res_data_list: 赛牛消息数据列表
+
+    Returns:
+        与输入一一对应，True表示新消息可处理；批次内重复的消息只保留第一条
     """
+    if not res_data_list:
+        return []
+
     try:
-        redis = await get_redis_client()
-        active_key = f"active_user:&&{user_key}&&last_active"
+        flags = await get_dedup_store().mark_many([get_dedup_key(res_data) for res_data in res_data_list])
 
-        # 设置活跃标记
-        await redis.setex(active_key, ttl, "1")
+        duplicates = flags.count(False)
+        if duplicates:
+            logger.info(f"批量去重过滤重复消息: {duplicates}条")
+        return flags
 
-        # 添加到活跃用户集合
-        await redis.sadd("active_user", active_key)
+    except Exception as e:
+        logger.error(f"批量消息去重失败: {str(e)}")
+        return [True] * len(res_data_list)  # 出错时默认允许处理
+
+
+async def release_sainiu_message(res_data: Dict[str, Any]):
+    """
+    撤销消息去重标记(消息未能处理时调用，允许重试)
 
+    Args:
+        res_data: 赛牛消息数据
+    """
+    try:
+        await get_dedup_store().release(get_dedup_key(res_data))
+
+    except Exception as e:
+        logger.error(f"撤销去重标记失败: {str(e)}")
+
+
+# 活跃用户截止时间索引: member=用户标识, score=到期时间戳
+ACTIVE_USER_ZSET = "active_user_deadline"
+
+# 原子地取出已到期用户及其初始数据、聚合消息，并一并清除
+# 返回 [[用户标识, 初始数据(HGETALL), 聚合消息(LRANGE)], ...]
+_CLAIM_EXPIRED_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local claimed = {}
+for _, member in ipairs(members) do
+    local initial_key = 'one@' .. member
+    local burst_key = 'burst@' .. member
+    claimed[#claimed + 1] = {
+        member,
+        redis.call('HGETALL', initial_key),
+        redis.call('LRANGE', burst_key, 0, -1),
+    }
+    redis.call('DEL', burst_key, initial_key)
+end
+if #members > 0 then
+    redis.call('ZREM', KEYS[1], unpack(members))
+end
+return claimed
+"""
+
+
+# 原子地缓存一条聚合消息: 追加消息、首条消息写入初始数据、按窗口规则更新到期时间
+# KEYS: 聚合消息List, 初始数据Hash, 截止时间索引
+# ARGV: 消息JSON, 当前时间, 安全TTL, 静默时长, 最长等待, 用户标识, 初始数据字段/值...
+_ADD_BURST_SCRIPT = """
+local length = redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('HSETNX', KEYS[2], 'burst_start', ARGV[2])
+if length == 1 then
+    for i = 7, #ARGV, 2 do
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+local now = tonumber(ARGV[2])
+local burst_start = tonumber(redis.call('HGET', KEYS[2], 'burst_start'))
+local ttl = math.max(0.05, math.min(tonumber(ARGV[4]), burst_start + tonumber(ARGV[5]) - now))
+redis.call('ZADD', KEYS[3], tostring(now + ttl), ARGV[6])
+return length
+"""
+
+
+async def set_active_user(user_key: str, ttl: float = 20):
+    """
+    设置活跃用户标记(记录到期时间)
+
+    Args:
+        user_key: 用户标识
+        ttl: 过期时间(秒)
+    """
+    try:
+        redis = await get_redis_client()
+        await redis.zadd(ACTIVE_USER_ZSET, {user_key: time.time() + ttl})
         logger.debug(f"用户活跃标记已设置: {user_key}")
 
     except Exception as e:
         logger.error(f"设置活跃用户失败: {str(e)}")
 
 
-async def check_inactive_users() -> Optional[Dict[str, Any]]:
+async def add_burst_message(
+    user_key: str,
+    data: Dict[str, Any],
+    idle_seconds: float,
+    max_wait: float
+) -> bool:
     """
-    检查非活跃用户（20秒未发消息）
+    缓存买家连续消息到聚合窗口
+
+    窗口在买家静默idle_seconds秒或首条消息后max_wait秒到期(取较早者)，
+    到期后由pop_inactive_users取出合并处理
+
+    Args:
+        user_key: 用户标识
+        data: 消息数据
+        idle_seconds: 静默时长(秒)
+        max_wait: 最长等待时长(秒)
 
     Returns:
-        非活跃用户数据或None
+        True表示已缓存，False表示未写入任何数据(由调用方直接处理该消息)
     """
     try:
         redis = await get_redis_client()
+        safety_ttl = int(max_wait + idle_seconds) + 3600
+
+        # 首条消息作为会话初始数据；活跃标记的到期时间即窗口到期时间
+        initial_data = [item for k, v in data.items() if v is not None for item in (k, str(v))]
+        await redis.eval(
+            _ADD_BURST_SCRIPT, 3,
+            f"burst@{user_key}", f"one@{user_key}", ACTIVE_USER_ZSET,
+            json.dumps(data, ensure_ascii=False), time.time(), safety_ttl,
+            idle_seconds, max_wait, user_key, *initial_data,
+        )
+        return True
+
+    except Exception as e:
+        logger.error(f"缓存聚合消息失败: {str(e)}")
+        return False
 
-        # 获取所有活跃用户Key
-        active_keys = await redis.smembers("active_user")
 
-        for key in active_keys:
-            # 检查Key是否过期
-            exists = await redis.exists(key)
-            if not exists:
-                # 用户已非活跃
-                # 提取用户标识
-                user_key = key.replace("active_user:&&", "").replace("&&last_active", "")
+async def pop_inactive_users(limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    批量取出已到期的非活跃用户
+
+    到期用户的移出索引与初始数据、聚合消息的读取清除在同一脚本中完成，
+    多进程不会重复取出，脚本执行失败时数据原样保留；
+    初始数据已缺失的孤立用户直接丢弃
+
+    Args:
+        limit: 最多取出数量
+
+    Returns:
+        非活跃用户数据列表，聚合窗口内的消息放在burst_messages字段
+    """
+    try:
+        redis = await get_redis_client()
+        claimed = await redis.eval(_CLAIM_EXPIRED_SCRIPT, 1, ACTIVE_USER_ZSET, time.time(), limit)
 
-                # 读取初始数据
-                initial_data_key = f"one@{user_key}"
-                initial_data = await redis.hgetall(initial_data_key)
+        users = []
+        for user_key, fields, burst_messages in claimed or []:
+            initial_data = dict(zip(fields[::2], fields[1::2]))
+            if not initial_data:
+                logger.debug(f"清理孤立活跃用户: {user_key}")
+                continue
 
-                if initial_data:
-                    # 删除活跃标记
-                    await redis.srem("active_user", key)
+            initial_data.pop("burst_start", None)
+            if burst_messages:
+                initial_data["burst_messages"] = [json.loads(item) for item in burst_messages]
 
-                    logger.info(f"检测到非活跃用户: {user_key}")
-                    return initial_data
+            logger.info(f"检测到非活跃用户: {user_key}")
+            users.append(initial_data)
 
-        return None
+        return users
 
     except Exception as e:
         logger.error(f"检查非活跃用户失败: {str(e)}")
-        return None
+        return []
+
+
+async def check_inactive_users() -> Optional[Dict[str, Any]]:
+    """
+    检查非活跃用户（20秒未发消息）
+
+    Returns:
+        非活跃用户数据或None，聚合窗口内的消息放在burst_messages字段
+    """
+    users = await pop_inactive_users(1)
+    return users[0] if users else None
 
 
 async def get_handle_zj_message(key: str) -> bool:
@@ -189,3 +330,119 @@ async def delete_redis_keys(pattern: str):
             await redis.delete(*keys)
     except Exception as e:
         logger.error(f"Redis DELETE失败: {str(e)}")
+
+
+# 租约为Hash: owner=持有者, token=fencing token, since=获得时间；token计数器为 {租约Key}:token
+
+# 获取或续期租约，返回fencing token(0表示未获得)；每次新获得租约时token递增
+_ACQUIRE_LEASE_SCRIPT = """
+local owner = redis.call('HGET', KEYS[1], 'owner')
+if owner == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return tonumber(redis.call('HGET', KEYS[1], 'token'))
+end
+if owner then
+    return 0
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('HSET', KEYS[1], 'owner', ARGV[1], 'token', token, 'since', ARGV[3])
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+return token
+"""
+
+# 仅当持有者匹配时续期
+_RENEW_LEASE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'owner') == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# 仅当持有者匹配时释放
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'owner') == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+async def acquire_lease(key: str, owner: str, ttl_ms: int) -> int:
+    """
+    获取租约(已持有时续期)
+
+    Args:
+        key: 租约Key
+        owner: 持有者标识
+        ttl_ms: 租约时长(毫秒)
+
+    Returns:
+        当前持有租约的fencing token，0表示未持有
+    """
+    try:
+        redis = await get_redis_client()
+        token = await redis.eval(
+            _ACQUIRE_LEASE_SCRIPT, 2, key, f"{key}:token", owner, ttl_ms, int(time.time())
+        )
+        return int(token or 0)
+
+    except Exception as e:
+        logger.error(f"获取租约失败 {key}: {str(e)}")
+        return 0
+
+
+async def renew_lease(key: str, owner: str, ttl_ms: int) -> bool:
+    """
+    续期租约
+
+    Args:
+        key: 租约Key
+        owner: 持有者标识
+        ttl_ms: 租约时长(毫秒)
+
+    Returns:
+        True表示续期成功
+    """
+    try:
+        redis = await get_redis_client()
+        return bool(await redis.eval(_RENEW_LEASE_SCRIPT, 1, key, owner, ttl_ms))
+
+    except Exception as e:
+        logger.error(f"续期租约失败 {key}: {str(e)}")
+        return False
+
+
+async def release_lease(key: str, owner: str):
+    """
+    释放租约
+
+    Args:
+        key: 租约Key
+        owner: 持有者标识
+    """
+    try:
+        redis = await get_redis_client()
+        await redis.eval(_RELEASE_LEASE_SCRIPT, 1, key, owner)
+
+    except Exception as e:
+        logger.error(f"释放租约失败 {key}: {str(e)}")
+
+
+async def get_lease(key: str) -> Dict[str, Any]:
+    """
+    查询租约持有情况
+
+    Args:
+        key: 租约Key
+
+    Returns:
+        {owner, token, since, ttl_ms}，无人持有时均为None
+    """
+    redis = await get_redis_client()
+    lease = await redis.hgetall(key)
+    return {
+        "owner": lease.get("owner"),
+        "token": int(lease["token"]) if lease.get("token") else None,
+        "since": int(lease["since"]) if lease.get("since") else None,
+        "ttl_ms": await redis.pttl(key) if lease else None,
+    }
@@ -16,7 +16,10 @@ async def create_ai_message_record(
     message: str,
     forwarded_to_agent: bool = False,
     send_dify_data_info: str = "",
-    data_type: str = "1"
+    data_type: str = "1",
+    sainiu_id: str = "",
+    main_latency_ms: Optional[int] = None,
+    review_latency_ms: Optional[int] = None
 ) -> Optional[AIMessageRecord]:
     """
     创建AI消息记录
@@ -30,6 +33,9 @@ async def create_ai_message_record(
         forwarded_to_agent: 是否转人工
         send_dify_data_info: 发送给Dify的数据
         data_type: 数据类型
+        sainiu_id: 赛牛消息ID
+        main_latency_ms: 主引擎耗时(毫秒)
+        review_latency_ms: 审核引擎耗时(毫秒)，未审核为None
 
     Returns:
         消息记录或None
@@ -44,6 +50,9 @@ async def create_ai_message_record(
             forwarded_to_agent=forwarded_to_agent,
             send_dify_data_info=send_dify_data_info,
             data_type=data_type,
+            sainiu_id=sainiu_id,
+            main_latency_ms=main_latency_ms,
+            review_latency_ms=review_latency_ms,
         )
         db.add(record)
         await db.commit()
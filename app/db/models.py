@@ -157,5 +157,8 @@ class AIMessageRecord(Base):
     send_dify_data_info = Column(Text, nullable=True, comment="发送给Dify的数据")
     data_type = Column(String(100), nullable=True, comment="数据类型编号(1-7)")
 
+    main_latency_ms = Column(Integer, nullable=True, comment="主引擎耗时(毫秒)")
+    review_latency_ms = Column(Integer, nullable=True, comment="审核引擎耗时(毫秒)")
+
     created_at = Column(DateTime, default=func.now(), comment="创建时间")
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment="更新时间")
@@ -1,11 +1,42 @@
 """
 Dify AI平台API客户端
 """
+import asyncio
+import hashlib
+import importlib.util
 import json
+import mimetypes
+import os
+import re
+import uuid
 import httpx
-from typing import Dict, Any, Optional, List
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, Optional, List
+from urllib.parse import urlsplit
 from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
+from app.common.utils.deadline import budget_timeout
+from app.redis.redis_client import get_redis_client
+from app.common.utils.images import fetch_image_bytes
+
+# HTTP/2依赖h2包，未安装时退回HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 文件分块读取大小
+_CHUNK_SIZE = 64 * 1024
+
+# SSE事件类型嗅探(event字段位于JSON开头，只在前段查找)
+_EVENT_PATTERN = re.compile(r'"event"\s*:\s*"([a-z_]+)"')
+_EVENT_SNIFF_CHARS = 64
+
+# 回复片段事件，及需要完整解析的事件
+_ANSWER_EVENTS = {"agent_message", "message"}
+_DECODE_EVENTS = _ANSWER_EVENTS | {"message_end", "error"}
+
+
+def _sniff_event(data_str: str) -> str:
+    """不解析JSON，直接取出SSE事件类型(无法识别时返回空字符串)"""
+    match = _EVENT_PATTERN.search(data_str, 0, _EVENT_SNIFF_CHARS)
+    return match.group(1) if match else ""
 
 
 class DifyClient:
@@ -24,6 +55,72 @@ class DifyClient:
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
         }
+        self.http: Optional[httpx.AsyncClient] = None
+
+        # 统计数据
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.remote_url_files = 0
+        self.cached_files = 0
+        self.uploaded_files = 0
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """获取连接池客户端(未创建时自动创建)"""
+        if self.http is None:
+            http2 = settings.DIFY_HTTP2 and HTTP2_AVAILABLE
+            if settings.DIFY_HTTP2 and not HTTP2_AVAILABLE:
+                logger.warning("未安装h2，Dify连接使用HTTP/1.1")
+            self.http = httpx.AsyncClient(
+                http2=http2,
+                timeout=settings.DIFY_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.DIFY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DIFY_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.DIFY_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self.http
+
+    async def connect(self):
+        """预建立连接(完成TLS握手)，失败不影响后续使用"""
+        try:
+            await self._get_http().get(
+                f"{self.base_url}/parameters",
+                params={"user": "neeko-warmup"},
+                headers=self.headers,
+                timeout=10.0,
+            )
+        except Exception as e:
+            logger.warning(f"Dify预连接失败: {str(e)}")
+
+    async def close(self):
+        """关闭连接池"""
+        if self.http:
+            await self.http.aclose()
+            self.http = None
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """连接池统计"""
+        stats = {
+            "http2": bool(self.http and settings.DIFY_HTTP2 and HTTP2_AVAILABLE),
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "files": {
+                "remote_url": self.remote_url_files,
+                "cached": self.cached_files,
+                "uploaded": self.uploaded_files,
+            },
+            "connections": 0,
+            "idle_connections": 0,
+        }
+        # httpx未公开连接池状态，读取底层httpcore连接池
+        pool = getattr(getattr(self.http, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None) or []
+        stats["connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+        return stats
 
     async def send_chat_message_async(
         self,
@@ -32,7 +129,9 @@ class DifyClient:
         inputs: Optional[Dict[str, Any]] = None,
         conversation_id: str = "",
         files: Optional[List[Dict[str, str]]] = None,
-        response_mode: str = "streaming"
+        response_mode: str = "streaming",
+        first_token: Optional[asyncio.Event] = None,
+        on_delta: Optional[Callable[[str], Awaitable[Any]]] = None
     ) -> Dict[str, Any]:
         """
         发送聊天消息(异步)
@@ -44,10 +143,16 @@ class DifyClient:
             conversation_id: 会话ID(为空则创建新会话)
             files: 文件列表 [{"type": "image", "transfer_method": "remote_url", "url": "..."}]
             response_mode: 响应模式 streaming/blocking
+            first_token: 收到首个回复片段时置位的事件(blocking模式在完成时置位)
+            on_delta: 流式模式下每收到一个回复片段时的回调
 
         Returns:
             AI响应数据
+
+        Raises:
+            DeadlineExceeded: 当前消息的处理预算已用完
         """
+        timeout = budget_timeout(settings.DIFY_TIMEOUT)
         try:
             url = f"{self.base_url}/chat-messages"
 
@@ -64,25 +169,36 @@ class DifyClient:
             if files:
                 payload["files"] = files
 
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                if response_mode == "streaming":
-                    # SSE流式响应
-                    return await self._handle_streaming_response(client, url, payload)
-                else:
-                    # Blocking模式
-                    response = await client.post(url, json=payload, headers=self.headers)
-                    response.raise_for_status()
-                    return response.json()
+            self.requests += 1
+            self.in_flight += 1
+            client = self._get_http()
+            if response_mode == "streaming":
+                # SSE流式响应
+                return await self._handle_streaming_response(client, url, payload, first_token, on_delta, timeout)
+            else:
+                # Blocking模式
+                response = await client.post(url, json=payload, headers=self.headers, timeout=timeout)
+                response.raise_for_status()
+                if first_token:
+                    first_token.set()
+                return response.json()
 
         except Exception as e:
+            self.errors += 1
             logger.error(f"Dify API调用失败: {str(e)}")
             return {}
 
+        finally:
+            self.in_flight -= 1
+
     async def _handle_streaming_response(
         self,
         client: httpx.AsyncClient,
         url: str,
-        payload: Dict[str, Any]
+        payload: Dict[str, Any],
+        first_token: Optional[asyncio.Event] = None,
+        on_delta: Optional[Callable[[str], Awaitable[Any]]] = None,
+        timeout: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         处理SSE流式响应
@@ -91,6 +207,9 @@ class DifyClient:
             client: HTTP客户端
             url: 请求URL
             payload: 请求数据
+            first_token: 收到首个回复片段时置位的事件
+            on_delta: 每收到一个回复片段时的回调
+            timeout: 超时时间(秒)
 
         Returns:
             完整的响应数据
@@ -100,7 +219,7 @@ class DifyClient:
             conversation_id = ""
             message_id = ""
 
-            async with client.stream("POST", url, json=payload, headers=self.headers) as response:
+            async with client.stream("POST", url, json=payload, headers=self.headers, timeout=timeout) as response:
                 response.raise_for_status()
 
                 async for line in response.aiter_lines():
@@ -111,12 +230,25 @@ class DifyClient:
                     if data_str.strip() == "[DONE]":
                         break
 
+                    # 先嗅探事件类型，忽略的事件(思考过程、ping等)不做JSON解析
+                    event = _sniff_event(data_str)
+                    if event and event not in _DECODE_EVENTS:
+                        continue
+
                     try:
                         data = json.loads(data_str)
                         event = data.get("event", "")
 
-                        if event == "agent_message":
-                            answer += data.get("answer", "")
+                        if event in _ANSWER_EVENTS:
+                            delta = data.get("answer", "")
+                            answer += delta
+                            if first_token and answer:
+                                first_token.set()
+                            if on_delta and delta:
+                                await on_delta(delta)
+
+                        if event == "error":
+                            logger.error(f"Dify流式响应错误: {data.get('message', '')}")
 
                         if "conversation_id" in data:
                             conversation_id = data["conversation_id"]
@@ -143,7 +275,7 @@ class DifyClient:
         user: str
     ) -> Optional[str]:
         """
-        上传文件到Dify
+        上传文件到Dify(分块从磁盘读取，不阻塞事件循环)
 
         Args:
             file_path: 本地文件路径
@@ -152,32 +284,194 @@ class DifyClient:
         Returns:
             文件ID(file_id)
         """
+        return await self._upload(os.path.basename(file_path), _iter_file(file_path), user)
+
+    async def upload_bytes(
+        self,
+        content: bytes,
+        filename: str,
+        user: str
+    ) -> Optional[str]:
+        """
+        上传内存中的文件到Dify
+
+        Args:
+            content: 文件内容
+            filename: 文件名
+            user: 用户标识
+
+        Returns:
+            文件ID(file_id)
+        """
+        async def chunks():
+            yield content
+
+        return await self._upload(filename, chunks(), user)
+
+    async def _upload(
+        self,
+        filename: str,
+        chunks: AsyncIterator[bytes],
+        user: str
+    ) -> Optional[str]:
+        """以multipart流式请求体上传文件"""
+        timeout = budget_timeout(60.0)
         try:
             url = f"{self.base_url}/files/upload"
+            boundary = uuid.uuid4().hex
+
+            async def body():
+                yield (
+                    f"--{boundary}\r\n"
+                    f'Content-Disposition: form-data; name="user"\r\n\r\n{user}\r\n'
+                    f"--{boundary}\r\n"
+                    f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                    f"Content-Type: {mimetypes.guess_type(filename)[0] or 'image/jpeg'}\r\n\r\n"
+                ).encode("utf-8")
+                async for chunk in chunks:
+                    yield chunk
+                yield f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+            }
+
+            self.requests += 1
+            response = await self._get_http().post(url, content=body(), headers=headers, timeout=timeout)
+            response.raise_for_status()
 
-            # 准备文件
-            with open(file_path, 'rb') as f:
-                files = {
-                    'file': (file_path.split('/')[-1], f, 'image/jpeg')
-                }
-                data = {
-                    'user': user
-                }
-
-                # 修改headers，移除Content-Type让httpx自动设置multipart
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                }
-
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.post(url, files=files, data=data, headers=headers)
-                    response.raise_for_status()
-
-                    result = response.json()
-                    file_id = result.get("id", "")
-                    logger.info(f"文件上传成功: {file_id}")
-                    return file_id
+            file_id = response.json().get("id", "")
+            logger.info(f"文件上传成功: {file_id}")
+            return file_id
 
         except Exception as e:
-            logger.error(f"文件上传失败 {file_path}: {str(e)}")
+            self.errors += 1
+            logger.error(f"文件上传失败 {filename}: {str(e)}")
             return None
+
+    async def get_image_file(self, source: str, user: str) -> Optional[Dict[str, str]]:
+        """
+        生成对话请求files参数中的图片项
+
+        - Dify可直接访问的公网图片(如淘宝CDN)使用remote_url，不下载不上传
+        - 其他图片按内容哈希复用已上传的file_id，未命中时上传并缓存
+
+        Args:
+            source: 图片URL或本地路径
+            user: 用户标识
+
+        Returns:
+            图片项，失败返回None
+        """
+        if is_remote_url_reachable(source):
+            self.remote_url_files += 1
+            return {"type": "image", "transfer_method": "remote_url", "url": source}
+
+        try:
+            if source.startswith(("http://", "https://")):
+                content = await fetch_image_bytes(source)
+                digest = hashlib.sha256(content).hexdigest()
+            else:
+                content = None
+                digest = await asyncio.to_thread(_hash_file, source)
+        except Exception as e:
+            logger.error(f"读取图片失败 {source}: {str(e)}")
+            return None
+
+        cache_key = f"dify_file:{hashlib.sha256(self.api_key.encode()).hexdigest()[:12]}:{digest}"
+        redis = await get_redis_client()
+        try:
+            file_id = await redis.get(cache_key)
+        except Exception as e:
+            logger.error(f"读取file_id缓存失败: {str(e)}")
+            file_id = None
+
+        if file_id:
+            self.cached_files += 1
+        else:
+            filename = os.path.basename(source.split("?")[0]) or f"{digest[:16]}.jpg"
+            if content is not None:
+                file_id = await self.upload_bytes(content, filename, user)
+            else:
+                file_id = await self.upload_file(source, user)
+            if not file_id:
+                return None
+            self.uploaded_files += 1
+            try:
+                await redis.setex(cache_key, settings.DIFY_FILE_CACHE_TTL, file_id)
+            except Exception as e:
+                logger.error(f"写入file_id缓存失败: {str(e)}")
+
+        return {"type": "image", "transfer_method": "local_file", "upload_file_id": file_id}
+
+
+def is_remote_url_reachable(source: str) -> bool:
+    """是否为Dify可直接访问的公网图片URL(按域名白名单判断)"""
+    if not source.startswith(("http://", "https://")):
+        return False
+    host = (urlsplit(source).hostname or "").lower()
+    return any(host == domain or host.endswith(f".{domain}") for domain in settings.DIFY_REMOTE_URL_HOSTS)
+
+
+def _hash_file(file_path: str) -> str:
+    """分块计算文件SHA-256(在线程中执行)"""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+async def _iter_file(file_path: str) -> AsyncIterator[bytes]:
+    """在线程中分块读取文件"""
+    f = await asyncio.to_thread(open, file_path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, _CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+# 进程内按APP_KEY复用的客户端
+_clients: Dict[str, DifyClient] = {}
+
+
+def get_dify_client(api_key: str) -> DifyClient:
+    """
+    获取指定APP_KEY的共享客户端
+
+    Args:
+        api_key: Dify应用API Key
+    """
+    client = _clients.get(api_key)
+    if client is None:
+        client = _clients[api_key] = DifyClient(api_key)
+    return client
+
+
+async def init_dify_clients():
+    """为已配置的APP_KEY创建客户端并预建立连接"""
+    for api_key in (settings.APP_KEY, settings.APP_KEY_TWO, settings.APP_KEY_THREE):
+        if api_key:
+            await get_dify_client(api_key).connect()
+    logger.info(f"Dify连接池已创建: {len(_clients)}个")
+
+
+async def close_dify_clients():
+    """关闭所有客户端连接池"""
+    for client in _clients.values():
+        await client.close()
+    _clients.clear()
+    logger.info("Dify连接池已关闭")
+
+
+def dify_pool_stats() -> Dict[str, Any]:
+    """各APP_KEY连接池统计(Key脱敏)"""
+    return {
+        f"{api_key[:8]}***": client.pool_stats()
+        for api_key, client in _clients.items()
+    }
@@ -1,10 +1,47 @@
 """
 赛牛客服平台API客户端
 """
+import asyncio
 import httpx
 from typing import Dict, Any, Optional
 from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
+from app.common.utils.ratelimit import TokenBucket, RetryBudget, jittered_backoff
+from app.common.utils.deadline import budget_timeout, remaining_seconds
+
+# GetNewNews全局限流(进程内所有调用方共享)
+news_rate_limiter = TokenBucket(settings.SAINIU_POLL_MAX_RATE)
+
+# 进程内共享的重试预算
+retry_budget = RetryBudget(settings.SAINIU_RETRY_BUDGET_RATIO, settings.SAINIU_RETRY_MIN_PER_SECOND)
+
+# 进程内共享的连接池客户端
+http_client: Optional[httpx.AsyncClient] = None
+
+
+async def get_sainiu_http_client() -> httpx.AsyncClient:
+    """获取赛牛连接池客户端(未初始化时自动创建)"""
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=settings.SAINIU_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.SAINIU_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SAINIU_MAX_KEEPALIVE,
+                keepalive_expiry=settings.SAINIU_KEEPALIVE_EXPIRY,
+            ),
+        )
+        logger.info("赛牛连接池已创建")
+    return http_client
+
+
+async def close_sainiu_http_client():
+    """关闭赛牛连接池客户端"""
+    global http_client
+    if http_client:
+        await http_client.aclose()
+        http_client = None
+        logger.info("赛牛连接池已关闭")
 
 
 class SainiuClient:
@@ -24,18 +61,30 @@ class SainiuClient:
 
         Returns:
             API响应数据
-        """
-        try:
-            url = f"{self.base_url}/api/{method}"
-            headers = {
-                "Content-Type": "application/json",
-            }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
+        Raises:
+            DeadlineExceeded: 当前消息的处理预算已用完
+        """
+        url = f"{self.base_url}/api/{method}"
+        headers = {
+            "Content-Type": "application/json",
+        }
+        timeout = settings.SAINIU_METHOD_TIMEOUTS.get(method, settings.SAINIU_TIMEOUT)
+        retryable = method in settings.SAINIU_RETRY_METHODS
+        connect_retryable = method in settings.SAINIU_CONNECT_RETRY_METHODS
+        retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            # 消息处理中的调用不超过剩余预算
+            call_timeout = budget_timeout(timeout)
+            try:
+                client = await get_sainiu_http_client()
                 response = await client.post(
                     url,
                     content=params,
-                    headers=headers
+                    headers=headers,
+                    timeout=call_timeout,
                 )
                 response.raise_for_status()
 
@@ -44,9 +93,43 @@ class SainiuClient:
                 logger.debug(f"赛牛API调用成功: {method}")
                 return result
 
-        except Exception as e:
-            logger.error(f"赛牛API调用失败 {method}: {str(e)}")
-            return {}
+            except Exception as e:
+                # 幂等方法的网络错误/5xx可重试；非幂等方法(如GetNewNews会取走消息)只在请求未发出时重试；
+                # 均受重试预算限制
+                if (
+                    attempt < settings.SAINIU_MAX_RETRIES
+                    and (
+                        (retryable and self._is_retryable_error(e))
+                        or (connect_retryable and self._is_unsent_error(e))
+                    )
+                    and retry_budget.try_withdraw()
+                ):
+                    delay = jittered_backoff(attempt, settings.SAINIU_RETRY_BASE_DELAY, settings.SAINIU_RETRY_MAX_DELAY)
+                    remaining = remaining_seconds()
+                    if remaining is not None and remaining <= delay:
+                        logger.error(f"赛牛API调用失败 {method}: {str(e)}，剩余预算不足，不再重试")
+                        return {}
+                    logger.warning(f"赛牛API调用失败 {method}: {str(e)}，{delay:.2f}s后重试")
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+                logger.error(f"赛牛API调用失败 {method}: {str(e)}")
+                return {}
+
+    @staticmethod
+    def _is_retryable_error(error: Exception) -> bool:
+        """是否为可重试的错误(网络错误或5xx)"""
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return False
+
+    @staticmethod
+    def _is_unsent_error(error: Exception) -> bool:
+        """请求是否确定未发出(连接失败、建连超时、等待连接池超时)"""
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
 
     async def async_functioncall(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -65,6 +148,7 @@ class SainiuClient:
 
     async def get_new_news(self) -> Dict[str, Any]:
         """获取新消息"""
+        await news_rate_limiter.acquire()
         return await self.async_httpcall("GetNewNews", "{}")
 
     async def send_messages(
@@ -0,0 +1,283 @@
+"""
+Dify回复缓存
+
+买家问题大量重复("在吗"、"有货吗"、"几天到"、"包邮吗")，相同产品上下文下的回复可以复用:
+- 精确匹配: 归一化后的问题 + 产品上下文
+- 近似匹配: 字符n-gram TF-IDF向量(哈希降维)余弦相似度，仅在同一产品上下文内比较
+- 单飞: 并发的相同问题只发起一次Dify调用，其余请求共享结果
+- TTL过期 + LRU淘汰；按意图跳过缓存(如售后、转人工类问题)
+"""
+import asyncio
+import re
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from app.common.config.chatwork_config import settings, ANSWER_CACHE_INTENT_KEYWORDS
+from app.common.utils.logger import logger
+
+# 哈希向量维度
+_DIMENSIONS = 1024
+
+# 归一化时移除的字符: 空白、标点、符号
+_STRIP_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_query(query: str) -> str:
+    """
+    问题归一化: 全角转半角、小写、去除空白和标点
+
+    Args:
+        query: 买家问题
+
+    Returns:
+        归一化后的问题
+    """
+    query = unicodedata.normalize("NFKC", query or "").lower()
+    return _STRIP_PATTERN.sub("", query)
+
+
+def classify_intent(query: str) -> str:
+    """
+    按关键词识别问题意图
+
+    Args:
+        query: 归一化后的问题
+
+    Returns:
+        意图名称，未命中返回"other"
+    """
+    for intent, keywords in ANSWER_CACHE_INTENT_KEYWORDS.items():
+        if any(keyword in query for keyword in keywords):
+            return intent
+    return "other"
+
+
+def _ngram_counts(query: str) -> np.ndarray:
+    """字符1-gram和2-gram的哈希词频向量"""
+    vector = np.zeros(_DIMENSIONS, dtype=np.float32)
+    grams = list(query) + [query[i:i + 2] for i in range(len(query) - 1)]
+    for gram in grams:
+        vector[zlib.crc32(gram.encode("utf-8")) % _DIMENSIONS] += 1
+    return vector
+
+
+class _Entry:
+    """缓存条目"""
+
+    __slots__ = ("key", "context", "query", "result", "expires", "slot")
+
+    def __init__(self, key: Tuple[str, str], result: Dict[str, Any], expires: float, slot: int):
+        self.key = key
+        self.context, self.query = key
+        self.result = result
+        self.expires = expires
+        self.slot = slot
+
+
+class AnswerCache:
+    """进程内Dify回复缓存"""
+
+    def __init__(self, max_entries: int, ttl: float, similarity: float):
+        """
+        初始化回复缓存
+
+        Args:
+            max_entries: 最大条目数
+            ttl: 条目有效期(秒)
+            similarity: 近似匹配的余弦相似度阈值
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._contexts: Dict[str, Set[int]] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+        # 每个槽位一行词频向量；文档频率用于计算IDF
+        self._counts = np.zeros((max_entries, _DIMENSIONS), dtype=np.float32)
+        self._doc_freq = np.zeros(_DIMENSIONS, dtype=np.float32)
+        self._free_slots: List[int] = list(range(max_entries - 1, -1, -1))
+        self._slots: List[Optional[_Entry]] = [None] * max_entries
+
+        # 统计数据
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _idf(self) -> np.ndarray:
+        """平滑IDF"""
+        documents = len(self._entries)
+        return np.log((1 + documents) / (1 + self._doc_freq)) + 1
+
+    def _remove(self, entry: _Entry):
+        """移除条目并归还槽位"""
+        self._entries.pop(entry.key, None)
+        slots = self._contexts.get(entry.context)
+        if slots is not None:
+            slots.discard(entry.slot)
+            if not slots:
+                del self._contexts[entry.context]
+        self._doc_freq -= self._counts[entry.slot] > 0
+        self._counts[entry.slot] = 0
+        self._slots[entry.slot] = None
+        self._free_slots.append(entry.slot)
+
+    def _get_exact(self, key: Tuple[str, str], now: float) -> Optional[_Entry]:
+        """精确匹配"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= now:
+            self.expirations += 1
+            self._remove(entry)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _get_near(self, context: str, query: str, now: float) -> Optional[_Entry]:
+        """同一上下文内按TF-IDF余弦相似度近似匹配"""
+        slots = self._contexts.get(context)
+        if not slots or self.similarity > 1:
+            return None
+
+        slot_list = list(slots)
+        idf = self._idf()
+        candidates = self._counts[slot_list] * idf
+        target = _ngram_counts(query) * idf
+        norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(target)
+        scores = candidates @ target / np.maximum(norms, 1e-9)
+
+        for index in np.argsort(-scores):
+            if scores[index] < self.similarity:
+                return None
+            entry = self._slots[slot_list[index]]
+            if entry.expires <= now:
+                self.expirations += 1
+                self._remove(entry)
+                continue
+            self._entries.move_to_end(entry.key)
+            return entry
+        return None
+
+    def _put(self, key: Tuple[str, str], result: Dict[str, Any]):
+        """写入条目(满时淘汰最久未使用的条目)"""
+        existing = self._entries.get(key)
+        if existing is not None:
+            self._remove(existing)
+        if not self._free_slots:
+            _, oldest = next(iter(self._entries.items()))
+            self.evictions += 1
+            self._remove(oldest)
+
+        slot = self._free_slots.pop()
+        counts = _ngram_counts(key[1])
+        self._counts[slot] = counts
+        self._doc_freq += counts > 0
+        entry = self._entries[key] = _Entry(key, result, time.monotonic() + self.ttl, slot)
+        self._slots[slot] = entry
+        self._contexts.setdefault(key[0], set()).add(slot)
+
+    async def fetch(
+        self,
+        query: str,
+        context: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        查询缓存，未命中时调用fetch并写入缓存
+
+        Args:
+            query: 买家问题
+            context: 产品上下文(型号、分类等)
+            fetch: 调用Dify的函数
+
+        Returns:
+            (AI响应数据, 来源: exact/near/shared/miss/bypass)
+        """
+        self.lookups += 1
+        normalized = normalize_query(query)
+        if (
+            not normalized
+            or len(normalized) > settings.ANSWER_CACHE_MAX_QUERY_LEN
+            or classify_intent(normalized) in settings.ANSWER_CACHE_BYPASS_INTENTS
+        ):
+            self.bypassed += 1
+            return await fetch(), "bypass"
+
+        key = (context, normalized)
+        now = time.monotonic()
+        entry = self._get_exact(key, now)
+        if entry is not None:
+            self.exact_hits += 1
+            return dict(entry.result), "exact"
+
+        entry = self._get_near(context, normalized, now)
+        if entry is not None:
+            self.near_hits += 1
+            logger.debug(f"回复缓存近似命中: {normalized} ≈ {entry.query}")
+            return dict(entry.result), "near"
+
+        # 单飞: 相同问题已在请求中时等待其结果
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.shared += 1
+            return dict(await asyncio.shield(inflight)), "shared"
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        result: Dict[str, Any] = {}
+        try:
+            result = await fetch()
+            if result and result.get("answer"):
+                self._put(key, _cacheable(result))
+            return result, "miss"
+        finally:
+            self._inflight.pop(key, None)
+            future.set_result(_cacheable(result) if result else {})
+
+    def clear(self):
+        """清空缓存"""
+        for entry in list(self._entries.values()):
+            self._remove(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计"""
+        hits = self.exact_hits + self.near_hits + self.shared
+        cacheable = self.lookups - self.bypassed
+        return {
+            "entries": len(self._entries),
+            "contexts": len(self._contexts),
+            "inflight": len(self._inflight),
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "shared": self.shared,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(hits / cacheable, 4) if cacheable else 0.0,
+        }
+
+
+def _cacheable(result: Dict[str, Any]) -> Dict[str, Any]:
+    """只缓存回复内容(会话ID、消息ID属于发起请求的买家)"""
+    return {"answer": result.get("answer", ""), "engine": result.get("engine", "")}
+
+
+# 全局回复缓存实例
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl=settings.ANSWER_CACHE_TTL,
+    similarity=settings.ANSWER_CACHE_SIMILARITY,
+)
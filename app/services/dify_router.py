@@ -0,0 +1,316 @@
+"""
+Dify引擎路由
+
+在主引擎(APP_KEY)与备用引擎(APP_KEY_THREE)之间路由对话请求:
+- 按引擎统计EWMA延迟与错误率，持续失败的引擎熔断一段时间
+- 主引擎在首字延迟的分位数截止时间内没有输出时，向备用引擎发起对冲请求，
+  取先成功的结果并取消另一个
+- 每个引擎的会话ID独立保存(会话ID不能跨Dify应用复用)
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from app.common.config.chatwork_config import settings
+from app.common.utils.api_helper import ExpiringArray
+from app.common.utils.logger import logger
+from app.libs.difyclinet import get_dify_client
+
+
+class EngineState:
+    """单个引擎的延迟、错误率与熔断状态"""
+
+    def __init__(self, name: str, api_key: str):
+        """
+        初始化引擎状态
+
+        Args:
+            name: 引擎名称
+            api_key: Dify应用API Key
+        """
+        self.name = name
+        self.api_key = api_key
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error = 0.0
+        self.first_token_samples: Deque[float] = deque(maxlen=settings.DIFY_LATENCY_WINDOW)
+
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_trial = False
+
+        # 统计数据
+        self.requests = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    @property
+    def circuit(self) -> str:
+        """熔断状态: closed/open/half_open"""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= settings.DIFY_CIRCUIT_COOLDOWN:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        """是否可以发送请求(半开状态只放行一个试探请求；只检查，不占用试探名额)"""
+        state = self.circuit
+        return state == "closed" or (state == "half_open" and not self.half_open_trial)
+
+    def claim_trial(self) -> bool:
+        """
+        实际发送请求时占用半开状态的试探名额
+
+        Returns:
+            是否占用了试探名额(占用后须调用release_trial释放)
+        """
+        if self.circuit != "half_open" or self.half_open_trial:
+            return False
+        self.half_open_trial = True
+        return True
+
+    def release_trial(self):
+        """释放试探名额(请求完成、失败或被取消)"""
+        self.half_open_trial = False
+
+    def hedge_delay(self) -> float:
+        """对冲截止时间: 首字延迟的分位数，样本不足时使用默认值"""
+        samples = sorted(self.first_token_samples)
+        if len(samples) < settings.DIFY_HEDGE_MIN_SAMPLES:
+            return settings.DIFY_HEDGE_DEFAULT_DELAY
+        index = min(len(samples) - 1, int(len(samples) * settings.DIFY_HEDGE_PERCENTILE / 100))
+        return min(settings.DIFY_HEDGE_MAX_DELAY, max(settings.DIFY_HEDGE_MIN_DELAY, samples[index]))
+
+    def record(self, success: bool, latency: float, first_token_latency: Optional[float]):
+        """
+        记录一次请求结果
+
+        Args:
+            success: 是否成功
+            latency: 总耗时(秒)
+            first_token_latency: 首字耗时(秒)
+        """
+        alpha = settings.DIFY_EWMA_ALPHA
+        self.requests += 1
+        self.ewma_error = alpha * (0 if success else 1) + (1 - alpha) * self.ewma_error
+
+        if success:
+            self.ewma_latency = latency if self.ewma_latency is None else alpha * latency + (1 - alpha) * self.ewma_latency
+            if first_token_latency is not None:
+                self.first_token_samples.append(first_token_latency)
+            self.consecutive_failures = 0
+            if self.opened_at is not None:
+                logger.info(f"Dify引擎恢复: {self.name}")
+            self.opened_at = None
+            return
+
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.DIFY_CIRCUIT_FAILURES or (
+            self.requests >= settings.DIFY_HEDGE_MIN_SAMPLES
+            and self.ewma_error >= settings.DIFY_CIRCUIT_ERROR_RATE
+        ):
+            if self.circuit != "open":
+                logger.warning(f"Dify引擎熔断: {self.name}, 连续失败{self.consecutive_failures}次")
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """引擎统计"""
+        return {
+            "circuit": self.circuit,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "ewma_error_rate": round(self.ewma_error, 3),
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges_won": self.hedges_won,
+        }
+
+
+class DifyRouter:
+    """主备Dify引擎路由"""
+
+    def __init__(self):
+        self.engines: List[EngineState] = []
+        self.hedges = 0
+
+    def _ensure_engines(self):
+        """按配置创建引擎状态(主引擎在前)"""
+        if self.engines:
+            return
+        for name, api_key in (("main", settings.APP_KEY), ("backup", settings.APP_KEY_THREE)):
+            if api_key:
+                self.engines.append(EngineState(name, api_key))
+
+    @staticmethod
+    def _conversation_key(user: str, engine: EngineState) -> str:
+        """会话ID存储Key: 主引擎沿用原有格式"""
+        return user if engine.name == "main" else f"{user}@{engine.name}"
+
+    async def _call(
+        self,
+        engine: EngineState,
+        query: str,
+        user: str,
+        inputs: Dict[str, Any],
+        files: Optional[List[Dict[str, str]]],
+        first_token: asyncio.Event,
+        on_delta: Optional[Callable[[str], Awaitable[Any]]] = None,
+        images: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """调用单个引擎并记录结果"""
+        client = get_dify_client(engine.api_key)
+        if images:
+            # 上传的file_id只在所属应用内有效，按引擎分别解析
+            resolved = await asyncio.gather(*(client.get_image_file(source, user) for source in images))
+            files = (files or []) + [item for item in resolved if item]
+
+        start = time.monotonic()
+        first_token_at: List[float] = []
+
+        async def mark_first_token():
+            await first_token.wait()
+            first_token_at.append(time.monotonic() - start)
+
+        watcher = asyncio.create_task(mark_first_token())
+        try:
+            conversation_key = self._conversation_key(user, engine)
+            conversation_id = await ExpiringArray.get_valid_items(conversation_key)
+            result = await client.send_chat_message_async(
+                query=query,
+                user=user,
+                inputs=inputs,
+                conversation_id=conversation_id,
+                files=files,
+                first_token=first_token,
+                on_delta=on_delta,
+            )
+        finally:
+            watcher.cancel()
+
+        success = bool(result and result.get("answer"))
+        engine.record(success, time.monotonic() - start, first_token_at[0] if first_token_at else None)
+        if not success:
+            return {}
+
+        if result.get("conversation_id"):
+            await ExpiringArray.add(conversation_key, result["conversation_id"])
+        result["engine"] = engine.name
+        return result
+
+    async def chat(
+        self,
+        query: str,
+        user: str,
+        inputs: Optional[Dict[str, Any]] = None,
+        files: Optional[List[Dict[str, str]]] = None,
+        on_delta: Optional[Callable[[str], Awaitable[Any]]] = None,
+        images: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        发送对话请求(熔断跳过、超时对冲、失败切换)
+
+        Args:
+            query: 用户查询内容
+            user: 用户标识
+            inputs: 输入变量
+            files: 文件列表
+            on_delta: 流式回复片段回调；只转发最先输出的引擎的片段，
+                      该引擎开始输出后不再切换引擎(避免买家收到两份回复)
+            images: 随消息发送的图片(URL或本地路径)
+
+        Returns:
+            AI响应数据(engine字段为实际应答的引擎)，全部失败返回{}
+        """
+        self._ensure_engines()
+        inputs = inputs or {}
+        candidates = [engine for engine in self.engines if engine.available()]
+        if not candidates:
+            # 全部熔断时仍尝试主引擎
+            candidates = self.engines[:1]
+        if not candidates:
+            logger.error("未配置Dify引擎")
+            return {}
+
+        primary, backups = candidates[0], candidates[1:]
+        owner: List[EngineState] = []
+
+        def start(engine: EngineState, first_token: asyncio.Event) -> asyncio.Task:
+            async def forward(text: str):
+                if not owner:
+                    owner.append(engine)
+                if owner[0] is engine:
+                    await on_delta(text)
+
+            handler = forward if on_delta else None
+            trial = engine.claim_trial()
+            task = asyncio.create_task(
+                self._call(engine, query, user, inputs, files, first_token, handler, images)
+            )
+            if trial:
+                # 完成、失败或被取消(包括尚未开始执行即被取消)时都释放试探名额
+                task.add_done_callback(lambda _: engine.release_trial())
+            return task
+
+        def next_backup() -> Optional[EngineState]:
+            # 对冲/切换时重新检查可用性(试探名额可能已被其他请求占用)
+            while backups:
+                engine = backups.pop(0)
+                if engine.available():
+                    return engine
+            return None
+
+        primary_token = asyncio.Event()
+        tasks = {start(primary, primary_token): primary}
+
+        try:
+            # 等待主引擎首字或完成，超过截止时间则对冲
+            if backups and settings.DIFY_HEDGE_ON:
+                token_wait = asyncio.create_task(primary_token.wait())
+                done, _ = await asyncio.wait(
+                    [token_wait, *tasks],
+                    timeout=primary.hedge_delay(),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                token_wait.cancel()
+                backup = next_backup() if not done else None
+                if backup:
+                    self.hedges += 1
+                    logger.info(f"Dify主引擎{primary.hedge_delay():.1f}s无输出，对冲至{backup.name}")
+                    tasks[start(backup, asyncio.Event())] = backup
+
+            # 取第一个成功结果，全部失败时依次切换剩余备用引擎
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    engine = tasks.pop(task)
+                    result = task.result()
+                    # 已有引擎开始流式输出时只采用该引擎的结果
+                    if owner and owner[0] is not engine:
+                        continue
+                    if result or owner:
+                        if result and engine is not primary:
+                            engine.hedges_won += 1
+                        return result
+                backup = next_backup() if not tasks else None
+                if backup:
+                    logger.info(f"Dify引擎调用失败，切换至{backup.name}")
+                    tasks[start(backup, asyncio.Event())] = backup
+
+            return {}
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """路由统计"""
+        self._ensure_engines()
+        return {
+            "hedges": self.hedges,
+            "engines": {engine.name: engine.stats() for engine in self.engines},
+        }
+
+
+# 全局路由实例
+dify_router = DifyRouter()
@@ -0,0 +1,162 @@
+"""
+双模型模式(AUX_OFF_ON)
+
+主引擎生成回复，审核引擎(APP_KEY_TWO)审核优化。主引擎流式输出时按句积累成段，
+每段一产生就提交审核，审核与后续生成并行进行；主引擎完成后最多再等待
+AUX_REVIEW_DEADLINE秒，未按时完成或失败的段落使用未审核的原文。
+"""
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.libs.difyclinet import get_dify_client
+from app.services.dify_router import dify_router
+
+# 句末标点(保留在句子末尾)
+_SENTENCE_END = re.compile(r"(?<=[。！？])")
+
+
+class _Review:
+    """单段审核"""
+
+    def __init__(self, text: str, task: asyncio.Task):
+        self.text = text
+        self.task = task
+
+
+class DualModelExecutor:
+    """主引擎 + 审核引擎并行执行"""
+
+    def __init__(self):
+        # 统计数据
+        self.runs = 0
+        self.segments = 0
+        self.reviewed = 0
+        self.fallbacks = 0
+
+    async def _review(self, segment: str, previous: str, query: str, user: str) -> str:
+        """
+        审核优化一段回复
+
+        Args:
+            segment: 待审核的回复段落
+            previous: 该段之前的回复(审核上下文)
+            query: 买家问题
+            user: 用户标识
+
+        Returns:
+            优化后的段落，失败返回空字符串
+        """
+        result = await get_dify_client(settings.APP_KEY_TWO).send_chat_message_async(
+            query=segment,
+            user=f"{user}@review",
+            inputs={"question": query, "previous": previous},
+            response_mode="blocking",
+        )
+        return (result or {}).get("answer", "").strip()
+
+    async def run(
+        self,
+        query: str,
+        user: str,
+        inputs: Optional[Dict[str, Any]] = None,
+        images: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        生成并审核回复
+
+        Args:
+            query: 买家问题
+            user: 用户标识
+            inputs: 输入变量
+            images: 随消息发送的图片
+
+        Returns:
+            AI响应数据(answer为审核后的回复)，附带两个模型的耗时；主引擎失败返回{}
+        """
+        self.runs += 1
+        start = time.monotonic()
+        reviews: List[_Review] = []
+        state = {"buffer": "", "review_start": None}
+
+        def submit(segment: str):
+            if not segment.strip():
+                return
+            if state["review_start"] is None:
+                state["review_start"] = time.monotonic()
+            previous = "".join(review.text for review in reviews)
+            task = asyncio.create_task(self._review(segment, previous, query, user))
+            reviews.append(_Review(segment, task))
+
+        async def on_delta(delta: str):
+            # 积累到一定长度的完整句子后提交审核
+            state["buffer"] += delta
+            parts = _SENTENCE_END.split(state["buffer"])
+            tail = parts.pop()
+            complete = "".join(parts)
+            if len(complete) >= settings.AUX_REVIEW_SEGMENT_CHARS:
+                submit(complete)
+                state["buffer"] = tail
+
+        try:
+            result = await dify_router.chat(query=query, user=user, inputs=inputs, on_delta=on_delta, images=images)
+            main_latency = time.monotonic() - start
+            if not result or not result.get("answer"):
+                return {}
+
+            # 流式片段与最终回复不一致(或为blocking响应)时整段审核
+            submitted = "".join(review.text for review in reviews)
+            if submitted + state["buffer"] == result["answer"]:
+                submit(state["buffer"])
+            else:
+                for review in reviews:
+                    review.task.cancel()
+                reviews.clear()
+                submit(result["answer"])
+
+            # 等待审核，超过截止时间的段落使用原文
+            if reviews:
+                await asyncio.wait([review.task for review in reviews], timeout=settings.AUX_REVIEW_DEADLINE)
+            parts, fallbacks = [], 0
+            for review in reviews:
+                reviewed = ""
+                if review.task.done() and not review.task.cancelled() and not review.task.exception():
+                    reviewed = review.task.result()
+                if reviewed:
+                    parts.append(reviewed)
+                else:
+                    fallbacks += 1
+                    parts.append(review.text)
+
+            self.segments += len(reviews)
+            self.reviewed += len(reviews) - fallbacks
+            self.fallbacks += fallbacks
+            if fallbacks:
+                logger.warning(f"审核未按时完成，{fallbacks}/{len(reviews)}段使用原回复")
+
+            result["unreviewed_answer"] = result["answer"]
+            result["answer"] = "".join(parts) or result["answer"]
+            result["main_latency_ms"] = int(main_latency * 1000)
+            review_start = state["review_start"] or time.monotonic()
+            result["review_latency_ms"] = int((time.monotonic() - review_start) * 1000)
+            result["review_fallbacks"] = fallbacks
+            return result
+
+        finally:
+            for review in reviews:
+                review.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """双模型统计"""
+        return {
+            "runs": self.runs,
+            "segments": self.segments,
+            "reviewed": self.reviewed,
+            "fallbacks": self.fallbacks,
+        }
+
+
+# 全局双模型执行器
+dual_model_executor = DualModelExecutor()
@@ -0,0 +1,153 @@
+"""
+本机推理服务客户端
+
+经Unix套接字调用推理服务(app.services.inference_server)，协议为每行一个JSON请求/响应。
+图片可以传路径，也可以传BGR图像数组: 数组写入multiprocessing.shared_memory，
+只传递共享内存名称、形状和类型，不重新编码。
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Any, Dict, Tuple, Union
+import numpy as np
+from app.common.config.chatwork_config import settings
+from app.common.utils.deadline import budget_timeout
+
+# 推理请求的图片: 路径或图像数组
+ImageInput = Union[str, np.ndarray]
+
+
+class InferenceError(Exception):
+    """推理服务返回错误"""
+
+
+class InferenceClient:
+    """推理服务客户端"""
+
+    def __init__(self, socket_path: str):
+        """
+        初始化客户端
+
+        Args:
+            socket_path: 推理服务Unix套接字路径
+        """
+        self.socket_path = socket_path
+
+        # 统计数据
+        self.requests = 0
+        self.errors = 0
+        self.shared_bytes = 0
+        self._latencies: deque = deque(maxlen=200)
+
+    async def _request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送一个请求并等待响应"""
+        reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=2 ** 20)
+        try:
+            writer.write(json.dumps(payload).encode("utf-8") + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+        if not line:
+            raise InferenceError("推理服务连接已关闭")
+        response = json.loads(line)
+        if response.get("status") != "ok":
+            raise InferenceError(response.get("message", "推理失败"))
+        return response
+
+    async def call(self, op: str, image: ImageInput, **options: Any) -> Dict[str, Any]:
+        """
+        调用推理服务
+
+        Args:
+            op: 操作名称(classify/yolo_ocr)
+            image: 图片路径或BGR图像数组
+            options: 操作参数(如yolo_ocr的oriented)
+
+        Returns:
+            推理服务响应
+
+        Raises:
+            InferenceError: 推理服务返回错误
+        """
+        self.requests += 1
+        start = time.monotonic()
+        segment = None
+        try:
+            payload: Dict[str, Any] = {"op": op, **options}
+            if isinstance(image, np.ndarray):
+                # 图像数组写入共享内存，推理服务直接映射读取
+                segment = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+                np.ndarray(image.shape, dtype=image.dtype, buffer=segment.buf)[...] = image
+                payload["image"] = {"shm": segment.name, "shape": list(image.shape), "dtype": image.dtype.str}
+                self.shared_bytes += image.nbytes
+            else:
+                payload["image"] = {"path": str(image)}
+
+            timeout = budget_timeout(settings.INFERENCE_TIMEOUT)
+            response = await asyncio.wait_for(self._request(payload), timeout=timeout)
+            self._latencies.append(time.monotonic() - start)
+            return response
+
+        except Exception:
+            self.errors += 1
+            raise
+
+        finally:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+
+    async def classify(self, image: ImageInput) -> Tuple[str, float]:
+        """
+        图片分类
+
+        Args:
+            image: 图片路径或BGR图像数组
+
+        Returns:
+            (分类结果, 置信度)
+        """
+        response = await self.call("classify", image)
+        return response["class_name"], response["confidence"]
+
+    async def yolo_ocr(self, image: ImageInput, oriented: bool = False) -> str:
+        """
+        标签检测 + OCR识别型号
+
+        Args:
+            image: 图片路径或BGR图像数组
+            oriented: 图片是否已按EXIF方向摆正
+
+        Returns:
+            识别出的产品型号
+        """
+        response = await self.call("yolo_ocr", image, oriented=oriented)
+        return response["text"]
+
+    async def ping(self) -> Dict[str, Any]:
+        """查询推理服务状态"""
+        return await asyncio.wait_for(self._request({"op": "ping"}), timeout=settings.INFERENCE_TIMEOUT)
+
+    def stats(self) -> Dict[str, Any]:
+        """客户端统计"""
+        latency = {"avg": None, "p95": None}
+        if self._latencies:
+            ordered = sorted(self._latencies)
+            latency = {
+                "avg": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            }
+        return {
+            "socket_path": self.socket_path,
+            "requests": self.requests,
+            "errors": self.errors,
+            "shared_bytes": self.shared_bytes,
+            "latency_ms": latency,
+        }
+
+
+# 全局推理服务客户端
+inference_client = InferenceClient(settings.INFERENCE_SOCKET_PATH)
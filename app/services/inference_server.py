@@ -0,0 +1,210 @@
+"""
+本机推理服务
+
+独立进程，启动时一次性加载classify.pt、best.pt及PaddleOCR并预热，
+通过Unix套接字为本机的FastAPI进程提供分类与OCR识别，
+模型内存每台主机只占一份，不随Web worker数量及worker重启重复加载。
+
+启动: python -m app.services.inference_server
+
+并发请求经微批队列合批(INFERENCE_BATCH_SIZE/INFERENCE_BATCH_WAIT_MS)，分类与检测+OCR的批次
+在同一个推理线程中依次执行，并行度只由算子内线程数(INFERENCE_THREADS)控制；
+INFERENCE_CPU_AFFINITY可将服务绑定到指定CPU核，避免与Web/worker进程争抢。
+"""
+import asyncio
+import json
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Any, Dict
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.common.utils import ocr
+from app.common.utils.images_recognition import (
+    OrcTextExtraction,
+    PLACEHOLDER_MODEL,
+    ocr_batcher,
+    load_models as load_detector,
+)
+
+
+def configure_threads():
+    """设置算子内线程数及CPU亲和性(须在导入torch/paddle之前调用)"""
+    threads = str(settings.INFERENCE_THREADS)
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(name, threads)
+
+    if settings.INFERENCE_CPU_AFFINITY and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, set(settings.INFERENCE_CPU_AFFINITY))
+        logger.info(f"推理服务已绑定CPU: {sorted(os.sched_getaffinity(0))}")
+
+
+def load_models():
+    """加载并预热全部模型"""
+    import cv2
+    import numpy as np
+
+    ocr.load_model()
+    _, paddle = load_detector()
+
+    try:
+        import torch
+        torch.set_num_threads(settings.INFERENCE_THREADS)
+    except ImportError:
+        pass
+
+    # 预热: 首次推理需初始化算子及内存池
+    start = time.monotonic()
+    blank = np.zeros((640, 640, 3), dtype=np.uint8)
+    ocr.predict(blank)
+    OrcTextExtraction.extract(blank)
+
+    # 空白图检测不到标签，不会调用OCR: 直接在带文字的小ROI上预热文字检测、方向分类及识别
+    if paddle is not None:
+        roi = np.full((48, 320, 3), 255, dtype=np.uint8)
+        cv2.putText(roi, PLACEHOLDER_MODEL, (8, 36), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+        paddle.ocr(roi, cls=True)
+    logger.info(f"推理服务模型预热完成: {time.monotonic() - start:.2f}s")
+
+
+async def _infer(request: Dict[str, Any], image: Any) -> Dict[str, Any]:
+    """
+    经微批队列执行一次推理
+
+    Args:
+        request: 推理请求
+        image: 图片路径或BGR图像数组
+
+    Returns:
+        推理结果
+    """
+    op = request.get("op", "")
+    if op == "classify":
+        class_name, confidence = await ocr.classify_batcher.submit(image)
+        return {"class_name": class_name, "confidence": confidence}
+    if op == "yolo_ocr":
+        return {"text": await ocr_batcher.submit((image, bool(request.get("oriented"))))}
+    raise ValueError(f"未知操作: {op}")
+
+
+async def _run(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    执行一次推理
+
+    Args:
+        request: 推理请求，image为{"path": 路径}
+            或{"shm": 共享内存名称, "shape": 形状, "dtype": 类型}
+
+    Returns:
+        推理结果
+    """
+    image = request.get("image") or {}
+    if "path" in image:
+        return await _infer(request, image["path"])
+
+    import numpy as np
+    segment = shared_memory.SharedMemory(name=image["shm"])
+    # 共享内存由调用方创建和释放，本进程只映射读取，不登记到resource_tracker
+    resource_tracker.unregister(segment._name, "shared_memory")
+    try:
+        array = np.ndarray(tuple(image["shape"]), dtype=np.dtype(image["dtype"]), buffer=segment.buf)
+        result = await _infer(request, array)
+        del array
+        return result
+    finally:
+        try:
+            segment.close()
+        except BufferError:
+            # 推理框架仍持有视图时由GC释放映射
+            pass
+
+
+class InferenceServer:
+    """Unix套接字推理服务"""
+
+    def __init__(self, socket_path: str):
+        """
+        初始化推理服务
+
+        Args:
+            socket_path: Unix套接字路径
+        """
+        self.socket_path = socket_path
+        self.started = time.time()
+
+        # 统计数据
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接(每行一个请求)"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self._dispatch(line)
+                writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line: bytes) -> Dict[str, Any]:
+        """执行请求并返回响应"""
+        try:
+            request = json.loads(line)
+            op = request.get("op", "")
+            if op == "ping":
+                return {"status": "ok", **self.stats()}
+
+            self.requests[op] = self.requests.get(op, 0) + 1
+            result = await _run(request)
+            return {"status": "ok", **result}
+
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"推理失败: {str(e)}")
+            return {"status": "error", "message": str(e)}
+
+    async def serve(self):
+        """启动服务并一直运行"""
+        path = Path(self.socket_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            path.unlink()
+
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=2 ** 20)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"推理服务已启动: {self.socket_path} (pid={os.getpid()})")
+        async with server:
+            await server.serve_forever()
+
+    def stats(self) -> Dict[str, Any]:
+        """服务统计"""
+        affinity = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        return {
+            "pid": os.getpid(),
+            "uptime": int(time.time() - self.started),
+            "threads": settings.INFERENCE_THREADS,
+            "cpu_affinity": affinity,
+            "requests": self.requests,
+            "errors": self.errors,
+            "batching": {
+                "classify": ocr.classify_batcher.stats(),
+                "yolo_ocr": ocr_batcher.stats(),
+            },
+        }
+
+
+def main():
+    """推理服务入口"""
+    configure_threads()
+    load_models()
+    asyncio.run(InferenceServer(settings.INFERENCE_SOCKET_PATH).serve())
+
+
+if __name__ == "__main__":
+    main()
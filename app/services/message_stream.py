@@ -0,0 +1,313 @@
+"""
+基于Redis Streams的跨进程消息分发
+
+- 接入端(轮询/推送)按买家将消息写入分区Stream: {STREAM_KEY}:{分区号}
+- 每个分区同一时刻只由一个消费者持有(租约)，通过消费组读取，保证同一买家的消息顺序
+- 消费者按存活数量均分分区；消费者宕机后租约过期，
+  新持有者通过XAUTOCLAIM接管其空闲超过租约时长的未确认(pending)消息
+- 消息处理完成(含被过滤)后才确认，处理失败或进程退出时保留在pending中；
+  持有者定期通过XAUTOCLAIM重新处理空闲超过STREAM_CLAIM_IDLE_MS的未确认消息
+"""
+import asyncio
+import json
+import math
+import os
+import socket
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Set
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.common.utils.redis_util import acquire_lease, renew_lease, release_lease, get_lease
+from app.redis.redis_client import get_redis_client
+
+
+def partition_of(data: Dict[str, Any]) -> int:
+    """计算消息所属分区"""
+    buyer_uid = str(data.get("buyerUid", ""))
+    return zlib.crc32(buyer_uid.encode("utf-8")) % settings.STREAM_PARTITIONS
+
+
+def stream_key(partition: int) -> str:
+    """分区Stream Key"""
+    return f"{settings.STREAM_KEY}:{partition}"
+
+
+async def publish_message(data: Dict[str, Any]):
+    """
+    写入消息到分区Stream
+
+    Args:
+        data: 消息数据
+    """
+    redis = await get_redis_client()
+    await redis.xadd(
+        stream_key(partition_of(data)),
+        {"data": json.dumps(data, ensure_ascii=False)},
+        maxlen=settings.STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+class StreamConsumer:
+    """分区Stream消费者"""
+
+    def __init__(self, name: Optional[str] = None):
+        """
+        初始化消费者
+
+        Args:
+            name: 消费者名称，默认 主机名-进程号
+        """
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.owned: Set[int] = set()
+        # 待接管的分区: 分区号 -> 最短空闲时长(毫秒)
+        self._to_recover: Dict[int, int] = {}
+        self._last_sweep = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._acks: Set[asyncio.Task] = set()
+
+        # 统计数据
+        self.consumed = 0
+        self.claimed = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """启动消费任务"""
+        if not self.running:
+            self._task = asyncio.create_task(self.run(), name="stream-consumer")
+
+    async def stop(self):
+        """停止消费任务并释放分区"""
+        for task in (self._task, self._heartbeat_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        self._heartbeat_task = None
+        # 等待已完成消息的确认写入
+        await asyncio.gather(*self._acks, return_exceptions=True)
+        await self._release_all()
+
+    async def run(self):
+        """消费主循环"""
+        await self._ensure_groups()
+        # 租约续期独立运行，避免长时间处理消息导致租约过期
+        self._heartbeat_task = asyncio.create_task(self._heartbeat(), name="stream-heartbeat")
+        logger.info(f"Stream消费者已启动: {self.name}")
+
+        while True:
+            try:
+                if not self.owned:
+                    await asyncio.sleep(settings.STREAM_LEASE_MS / 3000)
+                    continue
+                while self._to_recover:
+                    await self._recover(*self._to_recover.popitem())
+                await self._read_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Stream消费失败: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _heartbeat(self):
+        """定期续期与均衡分区"""
+        while True:
+            try:
+                await self._rebalance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Stream分区均衡失败: {str(e)}")
+            await asyncio.sleep(settings.STREAM_LEASE_MS / 3000)
+
+    async def _ensure_groups(self):
+        """创建所有分区的消费组"""
+        redis = await get_redis_client()
+        for partition in range(settings.STREAM_PARTITIONS):
+            try:
+                await redis.xgroup_create(stream_key(partition), settings.STREAM_GROUP, id="0", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def _rebalance(self):
+        """续期已持有分区，并按存活消费者数量均分分区"""
+        now = time.time()
+        redis = await get_redis_client()
+        ttl_ms = settings.STREAM_LEASE_MS
+        members_key = f"{settings.STREAM_KEY}:consumers"
+
+        # 心跳并统计存活消费者
+        await redis.zadd(members_key, {self.name: now})
+        await redis.zremrangebyscore(members_key, 0, now - ttl_ms / 1000)
+        alive = max(1, await redis.zcard(members_key))
+        fair_share = math.ceil(settings.STREAM_PARTITIONS / alive)
+
+        # 续期已持有分区
+        for partition in list(self.owned):
+            if not await renew_lease(self._lease_key(partition), self.name, ttl_ms):
+                self.owned.discard(partition)
+
+        # 持有过多时释放多余分区
+        while len(self.owned) > fair_share:
+            partition = self.owned.pop()
+            self._to_recover.pop(partition, None)
+            await release_lease(self._lease_key(partition), self.name)
+
+        # 获取空闲分区，并接管前任持有者未确认的消息(前任的租约已过期，空闲超过租约时长即可接管)
+        for partition in range(settings.STREAM_PARTITIONS):
+            if len(self.owned) >= fair_share:
+                break
+            if partition in self.owned:
+                continue
+            if await acquire_lease(self._lease_key(partition), self.name, ttl_ms):
+                self.owned.add(partition)
+                self._to_recover[partition] = ttl_ms
+
+        # 定期重新处理已持有分区内处理失败或长时间未确认的消息
+        if now - self._last_sweep >= settings.STREAM_CLAIM_IDLE_MS / 2000:
+            self._last_sweep = now
+            for partition in self.owned:
+                self._to_recover.setdefault(partition, settings.STREAM_CLAIM_IDLE_MS)
+
+    async def _recover(self, partition: int, min_idle_ms: int):
+        """
+        接管分区内长时间未确认的消息(XAUTOCLAIM)
+
+        Args:
+            partition: 分区号
+            min_idle_ms: 最短空闲时长(毫秒)
+        """
+        redis = await get_redis_client()
+        start_id = "0-0"
+        while True:
+            result = await redis.xautoclaim(
+                stream_key(partition),
+                settings.STREAM_GROUP,
+                self.name,
+                min_idle_time=min_idle_ms,
+                start_id=start_id,
+                count=settings.STREAM_BATCH,
+            )
+            start_id, entries = result[0], result[1]
+            if entries:
+                self.claimed += len(entries)
+                logger.info(f"接管未确认消息: 分区{partition}, {len(entries)}条")
+                await self._handle_entries(stream_key(partition), entries)
+            if start_id in ("0-0", b"0-0"):
+                break
+
+    async def _read_once(self):
+        """从已持有分区读取一批新消息"""
+        redis = await get_redis_client()
+        streams = {stream_key(partition): ">" for partition in self.owned}
+        response = await redis.xreadgroup(
+            settings.STREAM_GROUP,
+            self.name,
+            streams,
+            count=settings.STREAM_BATCH,
+            block=settings.STREAM_BLOCK_MS,
+        )
+        if not response:
+            return
+
+        # 分区之间并行，分区内部按顺序处理
+        await asyncio.gather(*(self._handle_entries(key, entries) for key, entries in response))
+
+    async def _handle_entries(self, key: str, entries: List[Any]):
+        """
+        按顺序投递一批消息，每条消息处理完成后再确认
+
+        Args:
+            key: Stream Key
+            entries: [(消息ID, 字段)]
+        """
+        from app.api.chatwork import handle_message
+
+        redis = await get_redis_client()
+        for entry_id, fields in entries:
+            if not fields:
+                # 消息已被裁剪
+                await redis.xack(key, settings.STREAM_GROUP, entry_id)
+                continue
+            try:
+                data = json.loads(fields["data"])
+            except (TypeError, ValueError) as e:
+                self._on_done(key, entry_id, e)
+                continue
+            await handle_message(data, lambda error, entry_id=entry_id: self._on_done(key, entry_id, error))
+
+    def _on_done(self, key: str, entry_id: Any, error: Optional[BaseException]):
+        """
+        消息处理结束回调: 成功时确认，失败时不确认，保留在pending中等待XAUTOCLAIM重试
+
+        Args:
+            key: Stream Key
+            entry_id: 消息ID
+            error: 处理失败时的异常
+        """
+        if error is not None:
+            self.errors += 1
+            logger.error(f"Stream消息处理失败 {entry_id}: {str(error)}")
+            return
+        task = asyncio.create_task(self._ack(key, entry_id))
+        self._acks.add(task)
+        task.add_done_callback(self._acks.discard)
+
+    async def _ack(self, key: str, entry_id: Any):
+        """确认消息"""
+        try:
+            redis = await get_redis_client()
+            await redis.xack(key, settings.STREAM_GROUP, entry_id)
+            self.consumed += 1
+        except Exception as e:
+            # 未确认的消息会被再次投递
+            self.errors += 1
+            logger.error(f"Stream消息确认失败 {entry_id}: {str(e)}")
+
+    async def _release_all(self):
+        """释放所有已持有分区"""
+        for partition in list(self.owned):
+            await release_lease(self._lease_key(partition), self.name)
+        self.owned.clear()
+
+    @staticmethod
+    def _lease_key(partition: int) -> str:
+        return f"{settings.STREAM_KEY}:owner:{partition}"
+
+    def stats(self) -> Dict[str, Any]:
+        """获取消费者统计"""
+        return {
+            "name": self.name,
+            "running": self.running,
+            "partitions": sorted(self.owned),
+            "consumed": self.consumed,
+            "claimed": self.claimed,
+            "errors": self.errors,
+        }
+
+
+# 全局消费者实例
+stream_consumer = StreamConsumer()
+
+
+async def get_stream_stats() -> Dict[str, Any]:
+    """获取各分区长度与pending数量"""
+    redis = await get_redis_client()
+    partitions = {}
+    for partition in range(settings.STREAM_PARTITIONS):
+        key = stream_key(partition)
+        pending = await redis.xpending(key, settings.STREAM_GROUP) if await redis.exists(key) else {}
+        partitions[partition] = {
+            "length": await redis.xlen(key),
+            "pending": pending.get("pending", 0) if pending else 0,
+            "owner": (await get_lease(StreamConsumer._lease_key(partition)))["owner"],
+        }
+    return {"consumer": stream_consumer.stats(), "partitions": partitions}
@@ -0,0 +1,291 @@
+"""
+分阶段消息处理流水线(SEDA)
+
+消息依次经过: 接入 → 预处理/识别 → AI调用 → 后处理 → 发送
+每个阶段拥有独立的有界队列和worker数量，队列满时上游阻塞等待，
+背压一直传递到拉取消息的轮询任务。
+同一买家的消息在每个阶段都路由到同一个worker，保证处理顺序。
+投递时可附带完成回调，消息离开流水线(完成、被过滤或处理失败)时调用。
+"""
+import asyncio
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.common.utils.metrics import message_throughput
+
+StageHandler = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+# 完成回调: 参数为处理失败时的异常，完成或被过滤时为None
+CompletionCallback = Callable[[Optional[BaseException]], None]
+
+
+class Stage:
+    """流水线阶段"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: StageHandler,
+        workers: int,
+        queue_size: int,
+        track_throughput: bool = True,
+    ):
+        """
+        初始化阶段
+
+        Args:
+            name: 阶段名称
+            handler: 处理函数，返回None表示消息在此阶段结束
+            workers: worker数量
+            queue_size: 每个worker的队列容量
+            track_throughput: 消息在此阶段结束时是否计入吞吐量
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.track_throughput = track_throughput
+        self.next_stage: Optional["Stage"] = None
+
+        self._queues: List[asyncio.Queue] = []
+        self._reserved: List[int] = []
+        self._tasks: List[asyncio.Task] = []
+
+        # 统计数据
+        self.processed = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def _index(self, data: Dict[str, Any]) -> int:
+        """按买家选择worker队列序号"""
+        buyer_uid = str(data.get("buyerUid", ""))
+        return zlib.crc32(buyer_uid.encode("utf-8")) % self.workers
+
+    def _partition(self, data: Dict[str, Any]) -> asyncio.Queue:
+        """按买家选择worker队列"""
+        return self._queues[self._index(data)]
+
+    def _has_room(self, index: int) -> bool:
+        """worker队列扣除已预留名额后是否还有空位"""
+        queue = self._queues[index]
+        return queue.maxsize <= 0 or queue.qsize() + self._reserved[index] < queue.maxsize
+
+    async def put(self, data: Dict[str, Any], on_done: Optional[CompletionCallback] = None):
+        """
+        投递消息(队列满时阻塞)
+
+        Args:
+            data: 消息数据
+            on_done: 完成回调
+        """
+        await self._partition(data).put((data, on_done))
+
+    def reserve(self, data: Dict[str, Any]) -> bool:
+        """
+        为消息预留所属worker队列的一个名额(之后须调用put_reserved或cancel_reservation)
+
+        Args:
+            data: 消息数据
+
+        Returns:
+            True表示预留成功，False表示队列已满
+        """
+        index = self._index(data)
+        if not self._has_room(index):
+            return False
+        self._reserved[index] += 1
+        return True
+
+    def cancel_reservation(self, data: Dict[str, Any]):
+        """
+        撤销预留的名额
+
+        Args:
+            data: 消息数据
+        """
+        index = self._index(data)
+        self._reserved[index] = max(0, self._reserved[index] - 1)
+
+    def put_reserved(self, data: Dict[str, Any], on_done: Optional[CompletionCallback] = None) -> bool:
+        """
+        使用预留的名额投递消息(不等待)
+
+        Args:
+            data: 消息数据
+            on_done: 完成回调
+
+        Returns:
+            True表示投递成功，False表示队列已满(名额被阻塞投递的put占用)
+        """
+        self.cancel_reservation(data)
+        try:
+            self._partition(data).put_nowait((data, on_done))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def put_nowait(self, data: Dict[str, Any], on_done: Optional[CompletionCallback] = None) -> bool:
+        """
+        投递消息(不等待，不占用他人预留的名额)
+
+        Args:
+            data: 消息数据
+            on_done: 完成回调
+
+        Returns:
+            True表示投递成功，False表示队列已满
+        """
+        if not self._has_room(self._index(data)):
+            return False
+        self._partition(data).put_nowait((data, on_done))
+        return True
+
+    def start(self):
+        """启动worker"""
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._reserved = [0] * self.workers
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"pipeline-{self.name}-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+
+    async def stop(self):
+        """停止worker"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, queue: asyncio.Queue):
+        """worker主循环"""
+        while True:
+            data, on_done = await queue.get()
+            start = time.perf_counter()
+            result = None
+            error = None
+            try:
+                result = await self.handler(data)
+            except Exception as e:
+                error = e
+                self.errors += 1
+                logger.error(f"流水线阶段[{self.name}]处理失败: {str(e)}")
+            finally:
+                latency = time.perf_counter() - start
+                self.processed += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+                queue.task_done()
+
+            if result is not None and self.next_stage:
+                await self.next_stage.put(result, on_done)
+                continue
+
+            # 消息在本阶段结束(完成、被过滤或处理失败)
+            if self.track_throughput:
+                message_throughput.record()
+            if on_done:
+                self._complete(on_done, error)
+
+    def _complete(self, on_done: CompletionCallback, error: Optional[BaseException]):
+        """调用完成回调(回调异常不影响worker)"""
+        try:
+            on_done(error)
+        except Exception as e:
+            logger.error(f"流水线阶段[{self.name}]完成回调失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取阶段统计"""
+        avg_latency = self.total_latency / self.processed if self.processed else 0.0
+        return {
+            "workers": self.workers,
+            "depth": sum(queue.qsize() for queue in self._queues),
+            "capacity": self.workers * self.queue_size,
+            "processed": self.processed,
+            "errors": self.errors,
+            "avg_latency_ms": round(avg_latency * 1000, 2),
+            "max_latency_ms": round(self.max_latency * 1000, 2),
+        }
+
+
+class MessagePipeline:
+    """分阶段消息处理流水线"""
+
+    def __init__(self):
+        self.stages: List[Stage] = []
+        self.running = False
+
+    def add_stage(self, stage: Stage):
+        """追加阶段并与上一阶段相连"""
+        if self.stages:
+            self.stages[-1].next_stage = stage
+        self.stages.append(stage)
+
+    async def submit(self, data: Dict[str, Any], on_done: Optional[CompletionCallback] = None):
+        """
+        提交消息到流水线入口(队列满时阻塞)
+
+        Args:
+            data: 消息数据
+            on_done: 完成回调，消息离开流水线时调用
+        """
+        await self.stages[0].put(data, on_done)
+
+    def start(self):
+        """启动所有阶段"""
+        for stage in self.stages:
+            stage.start()
+        self.running = True
+
+    async def stop(self):
+        """停止所有阶段"""
+        self.running = False
+        for stage in self.stages:
+            await stage.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取所有阶段统计"""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+
+# 全局流水线实例
+message_pipeline = MessagePipeline()
+
+
+def start_pipeline():
+    """构建并启动消息处理流水线"""
+    from app.api.chatwork import (
+        ingest_message,
+        preprocess_info,
+        request_ai_reply,
+        postprocess_reply,
+        send_reply,
+        with_deadline,
+    )
+
+    if message_pipeline.running:
+        return
+
+    queue_size = settings.PIPELINE_QUEUE_SIZE
+    message_pipeline.stages = []
+    # 每个阶段都在消息的剩余预算内执行
+    message_pipeline.add_stage(Stage("ingest", with_deadline(ingest_message), settings.PIPELINE_INGEST_WORKERS, queue_size))
+    message_pipeline.add_stage(Stage("preprocess", with_deadline(preprocess_info), settings.PIPELINE_PREPROCESS_WORKERS, queue_size))
+    message_pipeline.add_stage(Stage("ai", with_deadline(request_ai_reply), settings.PIPELINE_AI_WORKERS, queue_size))
+    message_pipeline.add_stage(Stage("postprocess", with_deadline(postprocess_reply), settings.PIPELINE_POSTPROCESS_WORKERS, queue_size))
+    message_pipeline.add_stage(Stage("send", with_deadline(send_reply), settings.PIPELINE_SEND_WORKERS, queue_size))
+    message_pipeline.start()
+    logger.info("消息处理流水线已启动")
+
+
+async def stop_pipeline():
+    """停止消息处理流水线"""
+    if message_pipeline.running:
+        await message_pipeline.stop()
+        logger.info("消息处理流水线已停止")
@@ -0,0 +1,40 @@
+"""
+赛牛推送消息接收队列
+
+推送接口只做校验、去重和入队，立即应答；
+后台worker按买家分区消费队列，保证同一买家的消息顺序。
+"""
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.services.pipeline import Stage
+
+
+async def _consume_push_message(data):
+    """消费推送消息"""
+    from app.api.chatwork import dispatch_message
+    await dispatch_message(data)
+    return None
+
+
+# 全局推送队列(吞吐量由下游处理统计)
+push_queue = Stage(
+    "push",
+    _consume_push_message,
+    settings.PUSH_WORKERS,
+    settings.PUSH_QUEUE_SIZE,
+    track_throughput=False,
+)
+
+
+def start_push_queue():
+    """启动推送队列消费"""
+    if not push_queue.running:
+        push_queue.start()
+        logger.info("推送消息队列已启动")
+
+
+async def stop_push_queue():
+    """停止推送队列消费"""
+    if push_queue.running:
+        await push_queue.stop()
+        logger.info("推送消息队列已停止")
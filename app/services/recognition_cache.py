@@ -0,0 +1,273 @@
+"""
+图片识别结果缓存
+
+买家反复发送同一张铭牌照片，不同买家也会发送相同的商品图，识别结果按图片复用:
+- URL: 规范化后的CDN地址(去掉淘宝尺寸后缀)，命中时不下载图片
+- 内容: 图片字节的SHA-256
+- 近似: dHash/pHash汉明距离均不超过阈值(再压缩、轻微缩放的同一张图)；
+  64位dHash切成(阈值+1)段建索引，距离不超过阈值的两个哈希至少有一段完全相同；
+  分段索引为按写入时间排序的ZSET，写入时清除过期项并只保留最新的若干项
+"""
+import asyncio
+import hashlib
+import io
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.redis.redis_client import get_redis_client
+
+# Redis Key前缀
+_KEY_PREFIX = "recognition"
+
+# pHash使用的32x32 DCT-II变换矩阵
+_DCT_SIZE = 32
+_DCT = np.cos(
+    np.pi * np.outer(np.arange(_DCT_SIZE), 2 * np.arange(_DCT_SIZE) + 1) / (2 * _DCT_SIZE)
+)
+
+
+def _to_int(bits: np.ndarray) -> int:
+    """布尔矩阵按行展开为整数"""
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+def perceptual_hashes(content: bytes) -> Tuple[int, int]:
+    """
+    计算图片的64位dHash与pHash(在线程中执行)
+
+    Args:
+        content: 图片字节
+
+    Returns:
+        (dHash, pHash)
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(content)) as image:
+        # JPEG按DCT缩放解码，只解出接近目标尺寸的灰度图
+        image.draft("L", (2 * _DCT_SIZE, 2 * _DCT_SIZE))
+        gray = image.convert("L")
+
+    # dHash: 9x8灰度图相邻像素比较
+    pixels = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    dhash = _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+    # pHash: 32x32灰度图DCT的左上8x8低频系数与中位数比较(中位数不含直流分量)
+    pixels = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8]
+    phash = _to_int(low > np.median(low.flatten()[1:]))
+
+    return dhash, phash
+
+
+class ImageFingerprint:
+    """图片指纹"""
+
+    __slots__ = ("sha256", "dhash", "phash")
+
+    def __init__(self, sha256: str, dhash: Optional[int] = None, phash: Optional[int] = None):
+        self.sha256 = sha256
+        self.dhash = dhash
+        self.phash = phash
+
+
+class RecognitionCache:
+    """Redis图片识别结果缓存"""
+
+    def __init__(self, ttl: int, max_distance: int, band_capacity: int):
+        """
+        初始化识别结果缓存
+
+        Args:
+            ttl: 缓存有效期(秒)
+            max_distance: 近似匹配的最大汉明距离(<0关闭近似匹配)
+            band_capacity: 每个分段索引保留的最新图片数
+        """
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.band_capacity = max(1, band_capacity)
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands if self.bands > 0 else 64
+
+        # 统计数据
+        self.lookups = 0
+        self.url_hits = 0
+        self.sha_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _url_key(self, url: str) -> str:
+        return f"{_KEY_PREFIX}:url:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+    def _sha_key(self, sha256: str) -> str:
+        return f"{_KEY_PREFIX}:sha:{sha256}"
+
+    def _band_keys(self, dhash: int) -> List[str]:
+        """dHash各分段的索引Key"""
+        mask = (1 << self.band_bits) - 1
+        return [
+            f"{_KEY_PREFIX}:band:{self.bands}:{index}:{(dhash >> (index * self.band_bits)) & mask:x}"
+            for index in range(self.bands)
+        ]
+
+    async def get_by_url(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        按规范化URL查询(命中时无需下载图片)
+
+        Args:
+            url: 规范化后的图片URL
+
+        Returns:
+            识别结果，未命中返回None(由get_by_content继续查询并计入查询次数)
+        """
+        try:
+            redis = await get_redis_client()
+            cached = await redis.get(self._url_key(url))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"读取识别缓存失败: {str(e)}")
+            return None
+
+        if cached:
+            self.lookups += 1
+            self.url_hits += 1
+            return json.loads(cached)
+        return None
+
+    async def get_by_content(self, content: bytes, url: str = "") -> Tuple[Optional[Dict[str, Any]], ImageFingerprint]:
+        """
+        按图片内容查询: 先精确匹配SHA-256，再按感知哈希近似匹配；命中时补写URL映射
+
+        Args:
+            content: 图片字节
+            url: 规范化后的图片URL
+
+        Returns:
+            (识别结果或None, 图片指纹)，指纹用于未命中时写入缓存
+        """
+        self.lookups += 1
+        fingerprint = ImageFingerprint(hashlib.sha256(content).hexdigest())
+        try:
+            redis = await get_redis_client()
+            cached = await redis.get(self._sha_key(fingerprint.sha256))
+            if cached:
+                self.sha_hits += 1
+                result = json.loads(cached)
+                if url:
+                    await redis.set(self._url_key(url), cached, ex=self.ttl)
+                return result, fingerprint
+
+            if self.max_distance < 0:
+                self.misses += 1
+                return None, fingerprint
+
+            fingerprint.dhash, fingerprint.phash = await asyncio.to_thread(perceptual_hashes, content)
+            result = await self._get_near(fingerprint)
+            if result is not None:
+                self.near_hits += 1
+                # 近似命中只补写精确映射，不加入分段索引，避免结果沿相似图片链传递
+                await self.put(fingerprint, result, url, index=False)
+                return result, fingerprint
+
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"读取识别缓存失败: {str(e)}")
+
+        self.misses += 1
+        return None, fingerprint
+
+    async def _get_near(self, fingerprint: ImageFingerprint) -> Optional[Dict[str, Any]]:
+        """
+        按dHash分段索引取候选(每段最多band_capacity个未过期的最新项)，
+        返回dHash/pHash距离均不超过阈值的最近一项；结果已过期的候选从索引中移除
+        """
+        redis = await get_redis_client()
+        pipe = redis.pipeline(transaction=False)
+        for key in self._band_keys(fingerprint.dhash):
+            pipe.zrevrangebyscore(key, "+inf", time.time() - self.ttl, start=0, num=self.band_capacity)
+        candidates = set().union(*await pipe.execute())
+
+        matches: List[Tuple[int, str, int, str]] = []
+        for member in candidates:
+            dhash, phash, sha256 = member.split(":")
+            distance = (int(dhash, 16) ^ fingerprint.dhash).bit_count()
+            if distance > self.max_distance:
+                continue
+            if (int(phash, 16) ^ fingerprint.phash).bit_count() > self.max_distance:
+                continue
+            matches.append((distance, sha256, int(dhash, 16), member))
+
+        for distance, sha256, dhash, member in sorted(matches):
+            cached = await redis.get(self._sha_key(sha256))
+            if cached:
+                logger.debug(f"识别缓存近似命中: {fingerprint.sha256[:12]} ≈ {sha256[:12]} (距离{distance})")
+                return json.loads(cached)
+
+            pipe = redis.pipeline(transaction=False)
+            for key in self._band_keys(dhash):
+                pipe.zrem(key, member)
+            await pipe.execute()
+        return None
+
+    async def put(
+        self,
+        fingerprint: ImageFingerprint,
+        result: Dict[str, Any],
+        url: str = "",
+        index: bool = True,
+    ):
+        """
+        写入识别结果
+
+        Args:
+            fingerprint: 图片指纹
+            result: 识别结果(producttype、product、confidence)
+            url: 规范化后的图片URL
+            index: 是否加入近似匹配的分段索引(仅模型识别的结果加入)
+        """
+        value = json.dumps(result, ensure_ascii=False)
+        try:
+            redis = await get_redis_client()
+            pipe = redis.pipeline(transaction=False)
+            pipe.set(self._sha_key(fingerprint.sha256), value, ex=self.ttl)
+            if url:
+                pipe.set(self._url_key(url), value, ex=self.ttl)
+            if index and fingerprint.dhash is not None and self.max_distance >= 0:
+                now = time.time()
+                member = f"{fingerprint.dhash:016x}:{fingerprint.phash:016x}:{fingerprint.sha256}"
+                for key in self._band_keys(fingerprint.dhash):
+                    # 按写入时间排序，清除结果已过期的项并只保留最新的band_capacity项
+                    pipe.zadd(key, {member: now})
+                    pipe.zremrangebyscore(key, "-inf", now - self.ttl)
+                    pipe.zremrangebyrank(key, 0, -self.band_capacity - 1)
+                    pipe.expire(key, self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"写入识别缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计"""
+        hits = self.url_hits + self.sha_hits + self.near_hits
+        return {
+            "lookups": self.lookups,
+            "url_hits": self.url_hits,
+            "sha_hits": self.sha_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "max_distance": self.max_distance,
+            "hit_rate": round(hits / self.lookups, 4) if self.lookups else 0.0,
+        }
+
+
+# 全局识别结果缓存实例
+recognition_cache = RecognitionCache(
+    ttl=settings.RECOGNITION_CACHE_TTL,
+    max_distance=settings.RECOGNITION_HASH_DISTANCE,
+    band_capacity=settings.RECOGNITION_BAND_CAPACITY,
+)
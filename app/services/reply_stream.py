@@ -0,0 +1,128 @@
+"""
+Dify回复逐句发送
+
+流式回复按句末标点(。！？)切分，每句经DiFyRuleC过滤、去重、URL检查后立即发送，
+买家无需等待整段回复生成完毕。
+句子由独立的发送任务按顺序发出，读取SSE流不等待发送完成。
+"""
+import asyncio
+import re
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Set
+from app.common.utils.logger import logger
+from app.common.utils.rule import DiFyRuleC
+
+# 句末标点(保留在句子末尾)
+_SENTENCE_END = re.compile(r"(?<=[。！？])")
+_URL_PATTERN = re.compile(r"https?://[^\s]+")
+
+
+class SentenceStreamer:
+    """按句切分并发送流式回复"""
+
+    def __init__(self, deliver: Callable[[str], Awaitable[Any]]):
+        """
+        初始化逐句发送器
+
+        Args:
+            deliver: 发送一句回复的函数
+        """
+        self.deliver = deliver
+        self.buffer = ""
+        self.received = False
+        self.failed = False
+        self.sent: List[str] = []
+        self._seen: Set[str] = set()
+        self._url_sent = False
+        self._start = time.monotonic()
+        self.first_sent_seconds: Optional[float] = None
+        self._queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def text(self) -> str:
+        """已发送的完整回复"""
+        return "".join(self.sent)
+
+    async def feed(self, delta: str):
+        """
+        追加回复片段，其中已完整的句子交给发送任务(不等待发出)
+
+        Args:
+            delta: 回复片段
+        """
+        self.received = True
+        self.buffer += delta
+        parts = _SENTENCE_END.split(self.buffer)
+        self.buffer = parts.pop()
+        for sentence in parts:
+            self._emit(sentence)
+
+    async def finish(self, send_tail: bool = True):
+        """
+        等待已切分的句子全部发出
+
+        Args:
+            send_tail: 是否发送剩余不以句末标点结尾的内容(回复中断时不发送不完整的末句)
+        """
+        tail, self.buffer = self.buffer, ""
+        if send_tail:
+            self._emit(tail)
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+
+    def cancel(self):
+        """取消尚未发出的句子(消息处理被中止时调用)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def _send_loop(self):
+        """按顺序发送句子，发送失败后不再发送后续句子"""
+        while True:
+            sentence = await self._queue.get()
+            if sentence is None:
+                return
+            if self.failed:
+                continue
+            try:
+                await self.deliver(sentence)
+            except Exception as e:
+                self.failed = True
+                logger.error(f"逐句发送失败，停止发送后续句子: {str(e)}")
+                continue
+
+            if self.first_sent_seconds is None:
+                self.first_sent_seconds = time.monotonic() - self._start
+                logger.info(f"首句回复已发送: 耗时{self.first_sent_seconds:.2f}s")
+            self.sent.append(sentence)
+
+    def _emit(self, sentence: str):
+        """过滤、去重、URL检查后交给发送任务"""
+        sentence = sentence.strip()
+        if not sentence or DiFyRuleC.filter_data(sentence) == "continue":
+            return
+
+        # 与已发送的句子去重
+        sentence = DiFyRuleC.deduplication(sentence)
+        if sentence in self._seen:
+            return
+        self._seen.add(sentence)
+
+        # 整段回复只保留第一个URL
+        sentence = DiFyRuleC.url_check(sentence)
+        urls = _URL_PATTERN.findall(sentence)
+        if urls:
+            if self._url_sent:
+                for url in urls:
+                    sentence = sentence.replace(url, "")
+                logger.info("多余的URL已移除")
+            self._url_sent = True
+
+        sentence = sentence.strip()
+        if not sentence:
+            return
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._send_loop())
+        self._queue.put_nowait(sentence)
@@ -0,0 +1,239 @@
+"""
+赛牛出站消息调度
+
+- 每个客服账号(userNick)一个令牌桶，突发回复排队发送，避免被千牛客户端限流丢弃
+- 同一买家排队中的多条回复合并为一次SendMessages调用
+- 同一账号对同一买家在窗口期内的相同回复只发送一次
+"""
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+from app.common.config.chatwork_config import settings
+from app.common.utils.dedup_store import fingerprint
+from app.common.utils.logger import logger
+from app.common.utils.ratelimit import TokenBucket
+from app.redis.redis_client import get_redis_client
+
+
+class _Batch:
+    """同一买家待发送的回复片段"""
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.keys: List[str] = []
+        self.created = time.monotonic()
+
+
+class AccountSender:
+    """单个客服账号的发送队列"""
+
+    def __init__(self, user_nick: str):
+        """
+        初始化发送队列
+
+        Args:
+            user_nick: 客服昵称
+        """
+        self.user_nick = user_nick
+        self.bucket = TokenBucket(settings.SEND_RATE, settings.SEND_BURST)
+        self.pending: "OrderedDict[str, _Batch]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._sending: Optional[asyncio.Task] = None
+
+        # 统计数据
+        self.sent = 0
+        self.fragments = 0
+        self.coalesced = 0
+        self.suppressed = 0
+        self.errors = 0
+        self.wait_samples: Deque[float] = deque(maxlen=200)
+        self.latency_samples: Deque[float] = deque(maxlen=200)
+
+    @property
+    def depth(self) -> int:
+        """排队中的回复片段数"""
+        return sum(len(batch.texts) for batch in self.pending.values())
+
+    def enqueue(self, buyer_nick: str, text: str, dedup_key: str):
+        """
+        加入发送队列，同一买家未发出的片段合并
+
+        Args:
+            buyer_nick: 买家昵称
+            text: 回复内容
+            dedup_key: 相同回复抑制Key
+        """
+        batch = self.pending.get(buyer_nick)
+        if batch is None:
+            batch = self.pending[buyer_nick] = _Batch()
+        else:
+            self.coalesced += 1
+
+        batch.texts.append(text)
+        batch.keys.append(dedup_key)
+        self.fragments += 1
+
+        if self._task is None or self._task.done():
+            # 发送任务长期运行并服务后续消息，不继承首条消息的上下文(处理截止时间等)
+            self._task = asyncio.create_task(
+                self._run(), name=f"sender-{self.user_nick}", context=contextvars.Context()
+            )
+        self._wakeup.set()
+
+    async def _run(self):
+        """按令牌桶速率依次发送各买家的合并回复"""
+        while True:
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # 给同一买家的后续片段留出合并时间
+            buyer_nick, batch = next(iter(self.pending.items()))
+            delay = batch.created + settings.SEND_COALESCE_SECONDS - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            await self.bucket.acquire()
+            # 等待令牌期间追加的片段一并发出
+            self.pending.pop(buyer_nick, None)
+            # 已出队的批次不随发送任务取消，由stop等待其发完
+            self._sending = asyncio.create_task(self._send(buyer_nick, batch))
+            await asyncio.shield(self._sending)
+            self._sending = None
+
+    async def _send(self, buyer_nick: str, batch: _Batch):
+        """发送一批合并回复"""
+        from app.libs.sainiuclient import SainiuClient
+
+        start = time.monotonic()
+        self.wait_samples.append(start - batch.created)
+        try:
+            result = await SainiuClient().send_messages(
+                user_nick=self.user_nick,
+                buyer_nick=buyer_nick,
+                text="\n".join(batch.texts),
+            )
+            if not result:
+                # 赛牛客户端调用失败时返回空结果而不抛出异常
+                raise RuntimeError("SendMessages调用失败")
+            self.sent += 1
+            self.latency_samples.append(time.monotonic() - start)
+            logger.info(f"回复已发送: {self.user_nick} -> {buyer_nick}, 合并{len(batch.texts)}条")
+
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"发送回复失败 {self.user_nick} -> {buyer_nick}: {str(e)}")
+            # 发送失败时撤销抑制标记，允许重发
+            await _release_keys(batch.keys)
+
+    async def stop(self):
+        """停止发送任务，并立即发出排队中的回复"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._sending:
+            await self._sending
+            self._sending = None
+
+        while self.pending:
+            buyer_nick, batch = self.pending.popitem(last=False)
+            await self._send(buyer_nick, batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """账号发送统计"""
+        return {
+            "queue_depth": self.depth,
+            "buyers_pending": len(self.pending),
+            "tokens": round(self.bucket.tokens, 2),
+            "sent": self.sent,
+            "fragments": self.fragments,
+            "coalesced": self.coalesced,
+            "suppressed": self.suppressed,
+            "errors": self.errors,
+            "wait_ms": _latency_stats(self.wait_samples),
+            "latency_ms": _latency_stats(self.latency_samples),
+        }
+
+
+def _latency_stats(samples: Deque[float]) -> Dict[str, Optional[float]]:
+    """平均值与P95(毫秒)"""
+    if not samples:
+        return {"avg": None, "p95": None}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        "avg": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p95": round(p95 * 1000, 2),
+    }
+
+
+async def _release_keys(keys: List[str]):
+    """撤销相同回复抑制标记"""
+    try:
+        redis = await get_redis_client()
+        await redis.delete(*keys)
+    except Exception as e:
+        logger.error(f"撤销回复抑制标记失败: {str(e)}")
+
+
+class SendScheduler:
+    """按客服账号调度出站消息"""
+
+    def __init__(self):
+        self.accounts: Dict[str, AccountSender] = {}
+
+    async def _is_duplicate(self, dedup_key: str) -> bool:
+        """窗口期内已发送过相同回复(跨进程，出错时放行)"""
+        try:
+            redis = await get_redis_client()
+            return not await redis.set(dedup_key, "1", nx=True, ex=settings.SEND_DEDUP_WINDOW)
+        except Exception as e:
+            logger.error(f"检查重复回复失败: {str(e)}")
+            return False
+
+    async def send(self, user_nick: str, buyer_nick: str, text: str) -> bool:
+        """
+        加入发送队列(不等待发出，便于同一买家的后续回复合并)
+
+        Args:
+            user_nick: 客服昵称
+            buyer_nick: 买家昵称
+            text: 回复内容
+
+        Returns:
+            True表示已入队，False表示相同回复被抑制
+        """
+        sender = self.accounts.get(user_nick)
+        if sender is None:
+            sender = self.accounts[user_nick] = AccountSender(user_nick)
+
+        dedup_key = f"sent@{user_nick}_{buyer_nick}_{fingerprint(text)}"
+        if settings.SEND_DEDUP_WINDOW > 0 and await self._is_duplicate(dedup_key):
+            sender.suppressed += 1
+            logger.info(f"相同回复已在窗口期内发送，跳过: {user_nick} -> {buyer_nick}")
+            return False
+
+        sender.enqueue(buyer_nick, text, dedup_key)
+        return True
+
+    async def stop(self):
+        """停止所有账号的发送任务"""
+        for sender in self.accounts.values():
+            await sender.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """各账号发送统计"""
+        return {user_nick: sender.stats() for user_nick, sender in self.accounts.items()}
+
+
+# 全局出站调度实例
+send_scheduler = SendScheduler()
@@ -0,0 +1,149 @@
+"""
+定时任务主节点选举
+
+每个定时任务对应一个Redis租约，同一时刻只有一个进程持有并执行该任务。
+- 租约较短并频繁续期，持有者宕机后其他进程在一个租约周期内接管
+- 进程正常退出时主动释放租约，实现快速切换
+- 每次获得租约时递增fencing token，执行副作用前可校验token，
+  防止租约已被接管的旧主节点继续写入
+租约读写使用redis_util中的通用租约函数(与Stream分区租约相同)
+"""
+import asyncio
+import functools
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+from app.common.utils.redis_util import acquire_lease, release_lease, get_lease
+
+
+class LeaderElection:
+    """基于Redis租约的主节点选举"""
+
+    def __init__(self, jobs: List[str]):
+        """
+        初始化选举
+
+        Args:
+            jobs: 需要选举主节点的任务ID列表
+        """
+        self.jobs = jobs
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        self.tokens: Dict[str, int] = {}
+        self._expires: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ttl_ms(self) -> int:
+        return settings.LEADER_LEASE_MS
+
+    @staticmethod
+    def _lease_key(job: str) -> str:
+        return f"{settings.LEADER_KEY_PREFIX}:{job}"
+
+    def is_leader(self, job: str) -> bool:
+        """
+        本进程是否为任务主节点(本地判断，租约本地视角过期即失效)
+
+        Args:
+            job: 任务ID
+        """
+        return job in self.tokens and time.monotonic() < self._expires.get(job, 0)
+
+    def token(self, job: str) -> Optional[int]:
+        """获取本进程持有的fencing token"""
+        return self.tokens.get(job) if self.is_leader(job) else None
+
+    async def check_fencing(self, job: str, token: Optional[int]) -> bool:
+        """
+        校验fencing token是否仍为最新
+
+        Args:
+            job: 任务ID
+            token: 本进程持有的token
+
+        Returns:
+            True表示仍是有效主节点
+        """
+        if token is None:
+            return False
+        lease = await get_lease(self._lease_key(job))
+        return lease["owner"] == self.owner and lease["token"] == token
+
+    def start(self):
+        """启动选举任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._campaign(), name="leader-election")
+            logger.info(f"主节点选举已启动: {self.owner}")
+
+    async def stop(self):
+        """停止选举并释放持有的租约"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        for job in list(self.tokens):
+            await release_lease(self._lease_key(job), self.owner)
+            logger.info(f"已释放主节点租约: {job}")
+        self.tokens.clear()
+        self._expires.clear()
+
+    async def _campaign(self):
+        """定期竞选/续期所有任务租约"""
+        while True:
+            for job in self.jobs:
+                await self._campaign_job(job)
+            await asyncio.sleep(self.ttl_ms / 3000)
+
+    async def _campaign_job(self, job: str):
+        """竞选/续期单个任务租约"""
+        # 以请求发出时间计算本地过期时间，保证本地视角不晚于Redis过期
+        started = time.monotonic()
+        token = await acquire_lease(self._lease_key(job), self.owner, self.ttl_ms)
+
+        if token:
+            if self.tokens.get(job) != token:
+                logger.info(f"成为任务主节点: {job}, token={token}")
+            self.tokens[job] = token
+            self._expires[job] = started + self.ttl_ms / 1000
+        elif job in self.tokens:
+            logger.warning(f"失去任务主节点: {job}")
+            self.tokens.pop(job, None)
+            self._expires.pop(job, None)
+
+    async def describe(self) -> Dict[str, Any]:
+        """获取各任务租约持有情况"""
+        leases = {}
+        for job in self.jobs:
+            lease = await get_lease(self._lease_key(job))
+            leases[job] = {**lease, "is_self": self.is_leader(job)}
+        return {"enabled": settings.LEADER_ELECTION_ON, "self": self.owner, "leases": leases}
+
+
+# 全局选举实例
+leader_election = LeaderElection(["check_new_info", "sync_stock"])
+
+
+def leader_only(job: str, fenced: bool = False):
+    """
+    仅在本进程为任务主节点时执行的装饰器
+
+    Args:
+        job: 任务ID
+        fenced: 执行前是否到Redis校验fencing token
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if settings.LEADER_ELECTION_ON:
+                if not leader_election.is_leader(job):
+                    return 0
+                if fenced and not await leader_election.check_fencing(job, leader_election.token(job)):
+                    logger.warning(f"fencing token已失效，跳过任务: {job}")
+                    return 0
+            return await func(*args, **kwargs)
+        return wrapper
+    return decorator
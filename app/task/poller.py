@@ -0,0 +1,139 @@
+"""
+自适应消息轮询
+
+替代固定1秒的IntervalTrigger: 有消息时立即再次拉取，
+队列空闲时按指数退避拉长间隔。
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.common.config.chatwork_config import settings
+from app.common.utils.logger import logger
+
+
+class AdaptivePoller:
+    """自适应轮询器"""
+
+    def __init__(
+        self,
+        poll_func: Callable[[], Awaitable[int]],
+        min_interval: float,
+        max_interval: float,
+        backoff_factor: float,
+        overrun_seconds: float,
+    ):
+        """
+        初始化轮询器
+
+        Args:
+            poll_func: 轮询函数，返回本轮处理的消息数
+            min_interval: 空闲退避的起始间隔(秒)
+            max_interval: 空闲退避的最大间隔(秒)
+            backoff_factor: 退避倍数
+            overrun_seconds: 单轮耗时超过该值视为超时
+        """
+        self.poll_func = poll_func
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.overrun_seconds = overrun_seconds
+
+        self.interval = min_interval
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计数据
+        self.cycles = 0
+        self.busy_cycles = 0
+        self.idle_cycles = 0
+        self.error_cycles = 0
+        self.overrun_cycles = 0
+        self.missed_cycles = 0
+        self.messages = 0
+        self.last_cycle_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """启动轮询任务"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="adaptive-poller")
+
+    def stop(self):
+        """停止轮询任务"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        """轮询主循环"""
+        while True:
+            start = time.monotonic()
+            handled = 0
+            try:
+                handled = await self.poll_func() or 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.error_cycles += 1
+                logger.error(f"自适应轮询失败: {str(e)}")
+
+            elapsed = time.monotonic() - start
+            self._record(handled, elapsed)
+
+            # 有消息立即再拉，无消息指数退避
+            if handled:
+                self.interval = self.min_interval
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(self.interval)
+                self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+
+    def _record(self, handled: int, elapsed: float):
+        """记录单轮统计"""
+        self.cycles += 1
+        self.messages += handled
+        self.last_cycle_seconds = elapsed
+
+        if handled:
+            self.busy_cycles += 1
+        else:
+            self.idle_cycles += 1
+
+        # 超时的轮次，以及固定间隔调度下会被跳过的轮次数
+        if elapsed > self.overrun_seconds:
+            self.overrun_cycles += 1
+            self.missed_cycles += int(elapsed // self.overrun_seconds)
+            logger.warning(f"轮询超时: 耗时{elapsed:.2f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取轮询统计"""
+        return {
+            "running": self.running,
+            "interval": round(self.interval, 3),
+            "cycles": self.cycles,
+            "busy_cycles": self.busy_cycles,
+            "idle_cycles": self.idle_cycles,
+            "error_cycles": self.error_cycles,
+            "overrun_cycles": self.overrun_cycles,
+            "missed_cycles": self.missed_cycles,
+            "messages": self.messages,
+            "last_cycle_ms": round(self.last_cycle_seconds * 1000, 2),
+        }
+
+
+async def _poll_new_info() -> int:
+    """拉取并处理一轮赛牛消息"""
+    from app.task.scheduler import check_new_info
+    return await check_new_info()
+
+
+# 全局轮询器实例
+message_poller = AdaptivePoller(
+    _poll_new_info,
+    min_interval=settings.POLL_MIN_INTERVAL,
+    max_interval=settings.POLL_MAX_INTERVAL,
+    backoff_factor=settings.POLL_BACKOFF_FACTOR,
+    overrun_seconds=settings.POLL_OVERRUN_SECONDS,
+)
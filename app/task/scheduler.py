@@ -3,24 +3,30 @@
 """
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from app.common.config.chatwork_config import settings
 from app.common.utils.logger import logger
+from app.task.leader import leader_only
+from app.task.poller import message_poller
 
 
 # 创建调度器
 scheduler = AsyncIOScheduler()
 
 
-async def check_new_info():
+@leader_only("check_new_info")
+async def check_new_info() -> int:
     """
     拉取赛牛新消息(每1秒执行一次)
     """
     try:
         from app.api.chatwork import check_new_info_data
-        await check_new_info_data()
+        return await check_new_info_data()
     except Exception as e:
         logger.error(f"拉取消息任务失败: {str(e)}")
+        return 0
 
 
+@leader_only("sync_stock", fenced=True)
 async def sync_stock():
     """
     同步库存(每24小时执行一次)
@@ -35,14 +41,19 @@ async def sync_stock():
 
 def start_scheduler():
     """启动定时任务调度器"""
-    # 添加消息拉取任务(每1秒)
-    scheduler.add_job(
-        check_new_info,
-        trigger=IntervalTrigger(seconds=1),
-        id="check_new_info",
-        name="拉取赛牛新消息",
-        replace_existing=True,
-    )
+    if settings.POLL_ADAPTIVE_ON:
+        # 自适应轮询(有消息立即拉取，空闲指数退避)
+        message_poller.start()
+        logger.info("自适应消息轮询已启动")
+    else:
+        # 添加消息拉取任务(每1秒)
+        scheduler.add_job(
+            check_new_info,
+            trigger=IntervalTrigger(seconds=1),
+            id="check_new_info",
+            name="拉取赛牛新消息",
+            replace_existing=True,
+        )
 
     # 添加库存同步任务(每24小时)
     scheduler.add_job(
@@ -59,6 +70,7 @@ def start_scheduler():
 
 def stop_scheduler():
     """停止定时任务调度器"""
+    message_poller.stop()
     if scheduler.running:
         scheduler.shutdown()
         logger.info("定时任务调度器已停止")